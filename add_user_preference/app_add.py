@@ -1,13 +1,19 @@
 from fastapi import FastAPI, HTTPException
-from db.mongo import get_mongo_client, get_user_taste_data
-from vector_db.embedder import embedder
-from vector_db.pinecone_client import PineconeManager
-from config import PINECONE_DIMENSION
-from bson.objectid import ObjectId
+from fastapi.responses import ORJSONResponse
+from db.mongo import get_mongo_client, iter_user_taste_data
+from db.models import TasteRecord
+from vector_db.bootstrap import get_pinecone_manager
 from mangum import Mangum
+from utils.batching import chunked
 
-app = FastAPI()
+# Responses are serialized with orjson rather than the stdlib json module
+app = FastAPI(default_response_class=ORJSONResponse)
 handler = Mangum(app)
+# Initialize PineconeManager once per container; warm invocations reuse it
+pinecone_manager = get_pinecone_manager()
+
+# Number of MongoDB documents embedded and upserted together.
+INGEST_CHUNK_SIZE = 100
 
 @app.post("/ingest")
 async def ingest_data_to_pinecone():
@@ -16,76 +22,71 @@ async def ingest_data_to_pinecone():
     """
     print("Starting data ingestion process...")
 
-    # --- Initialize Pinecone Manager ---
-    pinecone_manager = PineconeManager(embedder=embedder)
+    # --- Check Pinecone Manager ---
     if not pinecone_manager.pinecone or not pinecone_manager.index:
         raise HTTPException(status_code=500, detail="Pinecone initialization failed.")
 
-    # --- Load data from MongoDB ---
-    print("\n--- Loading data from MongoDB ---")
+    # --- Stream data from MongoDB into Pinecone ---
+    print("\n--- Streaming data from MongoDB into Pinecone ---")
     mongo_client = get_mongo_client()
     if not mongo_client:
         raise HTTPException(status_code=500, detail="Failed to connect to MongoDB.")
     
-    user_taste_data = get_user_taste_data(mongo_client)
-    mongo_client.close()
+    # The client is shared across warm invocations, so it is not closed here.
+    # Documents are streamed from the cursor and processed INGEST_CHUNK_SIZE at a
+    # time: each chunk is embedded and upserted before the next one is read, so
+    # memory stays bounded by the chunk size rather than the collection size.
+    documents_seen = 0
+    vectors_upserted = 0
+    try:
+        for chunk in chunked(iter_user_taste_data(mongo_client), INGEST_CHUNK_SIZE):
+            documents_seen += len(chunk)
+            vectors_to_upsert = _build_vectors(chunk, pinecone_manager)
+            if vectors_to_upsert:
+                pinecone_manager.upsert_vectors(vectors_to_upsert)
+                vectors_upserted += len(vectors_to_upsert)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed after {vectors_upserted} vectors: {e}")
 
-    if not user_taste_data:
+    if not documents_seen:
         return {"message": "No taste data found in MongoDB."}
-    
-    print(f"Loaded {len(user_taste_data)} documents.")
-
-    # --- Prepare data for Pinecone ---
-    vectors_to_upsert = []
-    for item in user_taste_data:
-        try:
-            user_id = item.get("user_id")
-            ingredient = item.get("ingredient")
-            amount = item.get("amount")
-            servings = item.get("servings")
-            cuisine = item.get("cuisine")
-            item_mongo_id = item.get("_id")
-            unit = item.get("unit", "")
-            feedback_weight = item.get("feedback_weight", 1.0)
-
-            if not all([user_id is not None, ingredient, amount is not None, servings is not None, cuisine, item_mongo_id]):
-                continue
 
-            pinecone_id = str(item_mongo_id)
-            taste_text = f"{ingredient} {amount}{unit} for {servings} servings in {cuisine} cuisine"
+    print(f"Processed {documents_seen} documents.")
 
-            try:
-                embedding = pinecone_manager.embedder.encode(taste_text).tolist()
-            except AttributeError:
-                embedding = pinecone_manager.embedder.encode(taste_text)
-                if not isinstance(embedding, list):
-                    continue
+    if not vectors_upserted:
+        return {"message": "No valid data to upsert into Pinecone."}
 
-            metadata = {
-                "user_id": str(user_id),
-                "ingredient": ingredient,
-                "amount": amount,
-                "unit": unit,
-                "servings": servings,
-                "cuisine": cuisine,
-                "feedback_weight": feedback_weight,
-                "original_text": taste_text
-            }
+    return {"message": f"Successfully upserted {vectors_upserted} vectors into Pinecone."}
 
-            vectors_to_upsert.append({
-                "id": pinecone_id,
-                "values": embedding,
-                "metadata": metadata
-            })
 
+def _build_vectors(user_taste_data, pinecone_manager):
+    """
+    Validates a chunk of MongoDB documents, embeds their taste texts in one
+    batched call, and returns them in Pinecone upsert format.
+    """
+    # Pass 1: validate documents into TasteRecords.
+    records = []
+    for item in user_taste_data:
+        try:
+            record = TasteRecord.from_mongo(item)
         except Exception as e:
             print(f"Error processing document {item.get('_id')}: {e}")
             continue
+        if record:
+            records.append(record)
 
-    if not vectors_to_upsert:
-        return {"message": "No valid data to upsert into Pinecone."}
+    if not records:
+        return []
 
-    print("\n--- Upserting into Pinecone ---")
-    pinecone_manager.upsert_vectors(vectors_to_upsert)
+    # Pass 2: embed every taste_text in batched forward passes.
+    # SentenceTransformer sorts each batch by length internally to minimise padding.
+    try:
+        embeddings = pinecone_manager.embedder.encode(
+            [record.taste_text for record in records], batch_size=64, show_progress_bar=False, convert_to_numpy=True, as_numpy=True
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to embed taste data: {e}")
 
-    return {"message": f"Successfully upserted {len(vectors_to_upsert)} vectors into Pinecone."}
+    return [record.to_upsert(embedding) for record, embedding in zip(records, embeddings)]
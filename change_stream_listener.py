@@ -1,24 +1,45 @@
 # project_root/change_stream_listener.py
-from db.mongo import get_mongo_client
-from vector_db.embedder import embedder # Import the embedder instance
-from vector_db.pinecone_client import PineconeManager # Import the class
+from db.mongo import get_mongo_client, close_mongo_client
+from vector_db.bootstrap import get_pinecone_manager # Shared PineconeManager (and embedder)
+from vector_db.pinecone_client import PineconeManager # Import the class (type hints)
 from config import MONGO_DB_NAME, MONGO_COLLECTION_NAME, PINECONE_INDEX_NAME # Import names for printing
 import time
+from collections import OrderedDict
 from pymongo import MongoClient
-from pymongo.collection import Collection
-from bson.objectid import ObjectId
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from db.models import TasteRecord
 
-def process_change_event(change: Dict[str, Any], pinecone_manager: PineconeManager, mongo_db: MongoClient):
+# Change events are buffered and embedded/upserted together. A buffer is
+# flushed once it holds CHANGE_BATCH_MAX_SIZE events, or once the oldest
+# buffered event has waited CHANGE_BATCH_MAX_WAIT_SECONDS.
+CHANGE_BATCH_MAX_SIZE = 32
+CHANGE_BATCH_MAX_WAIT_SECONDS = 0.05
+
+# Last taste_text embedded for each document ID, bounded LRU. A change whose
+# text matches the cached one only needs a metadata update, not a new embedding.
+EMBEDDED_TEXT_CACHE_SIZE = 10000
+_last_embedded_text: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _remember_embedded_text(vector_id: str, taste_text: str):
+    """Records the text last embedded for `vector_id`, evicting the oldest entries."""
+    _last_embedded_text[vector_id] = taste_text
+    _last_embedded_text.move_to_end(vector_id)
+    while len(_last_embedded_text) > EMBEDDED_TEXT_CACHE_SIZE:
+        _last_embedded_text.popitem(last=False)
+
+
+def _prepare_change_record(change: Dict[str, Any], mongo_db: MongoClient) -> Optional[TasteRecord]:
     """
-    Processes a single change event from the MongoDB Change Stream.
-    Handles inserts, updates, and replaces by upserting to Pinecone (default namespace).
-    DELETE operations are ignored as requested.
+    Turns a single change event into the data needed for a Pinecone upsert.
+    Handles inserts, updates, and replaces. DELETE operations are ignored as requested.
 
     Args:
         change: The change event dictionary.
-        pinecone_manager: The initialized PineconeManager instance.
         mongo_db: The connected MongoDB database instance.
+
+    Returns:
+        The validated TasteRecord, or None if the event should not be upserted.
     """
     operation_type = change.get("operationType")
     document_key = change.get("documentKey")
@@ -29,122 +50,151 @@ def process_change_event(change: Dict[str, Any], pinecone_manager: PineconeManag
     # Note: This listener IGNORES delete operations. Vectors for deleted
     # documents will remain in Pinecone as requested.
 
+    print(f"\nProcessing Change Event: {operation_type} on ID {pinecone_id}")
+
+    if operation_type == "insert" or operation_type == "update" or operation_type == "replace":
+        # For insert, update, or replace, get the full document
+        # If the full document is not available in the change event, you might need to fetch it
+        full_document = change.get("fullDocument")
+
+        if not full_document:
+             print(f"Warning: Full document not available for {operation_type} on ID {pinecone_id}. Attempting to fetch document from MongoDB...")
+             if mongo_object_id:
+                  try:
+                       collection = mongo_db[MONGO_COLLECTION_NAME]
+                       full_document = collection.find_one({"_id": mongo_object_id})
+                       if not full_document:
+                            print(f"Error: Could not fetch document with ID {mongo_object_id} from MongoDB after {operation_type} event. Skipping upsert.")
+                            return None
+                  except Exception as fetch_e:
+                       print(f"Error fetching document {mongo_object_id} from MongoDB: {fetch_e}. Skipping upsert.")
+                       return None
+             else:
+                  print(f"Error: Document key (_id) not available for {operation_type} event. Cannot fetch or upsert.")
+                  return None
+
+        # Prepare data for upsert, similar to ingest_data.py
+        record = TasteRecord.from_mongo(full_document)
+        if record is None:
+             print(f"Warning: Missing required fields in document ID {full_document.get('_id')} for {operation_type}. Skipping upsert.")
+             return None
+
+        return record
+
+    else:
+        # Handle other operation types if necessary
+        # (delete events are already excluded by the change stream pipeline)
+        print(f"Skipping Change Event with unhandled operation type: {operation_type}")
+
+    return None
+
+
+def flush_change_events(changes: List[Dict[str, Any]], pinecone_manager: PineconeManager, mongo_db: MongoClient):
+    """
+    Processes a batch of change events from the MongoDB Change Stream.
+    All upsertable events are embedded with one encode() call and written
+    to Pinecone (default namespace) with one upsert_vectors() call.
+
+    Rapid repeated events for the same document are coalesced to the latest
+    one, and documents whose taste_text is unchanged since it was last
+    embedded only get a metadata update (e.g. a feedback_weight bump).
+
+    Args:
+        changes: The buffered change event dictionaries.
+        pinecone_manager: The initialized PineconeManager instance.
+        mongo_db: The connected MongoDB database instance.
+    """
+    if not changes:
+        return
+
     if not pinecone_manager.index or not pinecone_manager.embedder:
          print("Pinecone or Embedder not ready. Skipping change event processing.")
          return
 
-    print(f"\nProcessing Change Event: {operation_type} on ID {pinecone_id}")
+    # Keep only the latest event per document ID, ordered by its last occurrence
+    latest_changes = {}
+    for change in changes:
+        document_key = change.get("documentKey") or {}
+        key = str(document_key.get("_id"))
+        latest_changes.pop(key, None)
+        latest_changes[key] = change
+
+    records = []
+    for change in latest_changes.values():
+        try:
+            record = _prepare_change_record(change, mongo_db)
+        except Exception as e:
+            document_key = change.get("documentKey") or {}
+            print(f"Error processing change event for ID {document_key.get('_id')}: {e}")
+            continue
+        if record:
+            records.append(record)
+
+    if not records:
+        return
 
-    try:
-        if operation_type == "insert" or operation_type == "update" or operation_type == "replace":
-            # For insert, update, or replace, get the full document
-            # If the full document is not available in the change event, you might need to fetch it
-            full_document = change.get("fullDocument")
-
-            if not full_document:
-                 print(f"Warning: Full document not available for {operation_type} on ID {pinecone_id}. Attempting to fetch document from MongoDB...")
-                 if mongo_object_id:
-                      try:
-                           collection = mongo_db[MONGO_COLLECTION_NAME]
-                           full_document = collection.find_one({"_id": mongo_object_id})
-                           if not full_document:
-                                print(f"Error: Could not fetch document with ID {mongo_object_id} from MongoDB after {operation_type} event. Skipping upsert.")
-                                return
-                      except Exception as fetch_e:
-                           print(f"Error fetching document {mongo_object_id} from MongoDB: {fetch_e}. Skipping upsert.")
-                           return
-                 else:
-                      print(f"Error: Document key (_id) not available for {operation_type} event. Cannot fetch or upsert.")
-                      return
-
-            # Prepare data for upsert, similar to ingest_data.py
-            user_id = full_document.get("user_id")
-            ingredient = full_document.get("ingredient")
-            amount = full_document.get("amount")
-            servings = full_document.get("servings")
-            cuisine = full_document.get("cuisine")
-            item_mongo_id = full_document.get("_id")
-
-            unit = full_document.get("unit", "")
-            feedback_weight = full_document.get("feedback_weight", 1.0)
-
-            if not all([user_id is not None, ingredient, amount is not None, servings is not None, cuisine, item_mongo_id]):
-                 print(f"Warning: Missing required fields in document ID {item_mongo_id} for {operation_type}. Skipping upsert.")
-                 return
-
-            current_pinecone_id = str(item_mongo_id)
-            taste_text = f"{ingredient} {amount}{unit} for {servings} servings in {cuisine} cuisine"
+    # Unchanged text -> same embedding, so only the metadata needs to be written
+    records_to_embed = []
+    for record in records:
+        if _last_embedded_text.get(record.mongo_id) == record.taste_text:
+            print(f"Text unchanged for ID '{record.mongo_id}'. Updating metadata only.")
+            pinecone_manager.update_metadata(record.mongo_id, record.metadata)
+        else:
+            records_to_embed.append(record)
 
-            try:
-                embedding = pinecone_manager.embedder.encode(taste_text).tolist()
-            except AttributeError:
-                 embedding = pinecone_manager.embedder.encode(taste_text)
-                 if not isinstance(embedding, list):
-                     print(f"Warning: Embedder did not return a list or numpy array for ID '{current_pinecone_id}'. Skipping upsert.")
-                     return
+    if not records_to_embed:
+        return
 
+    try:
+        embeddings = pinecone_manager.embedder.encode(
+            [record.taste_text for record in records_to_embed], batch_size=CHANGE_BATCH_MAX_SIZE, as_numpy=True
+        )
 
-            # Prepare metadata for upsert
-            # Ensure amount and weight are numerical types in metadata
-            try:
-                 amount_num = float(amount)
-            except (ValueError, TypeError):
-                 print(f"Warning: Could not convert amount '{amount}' to float for ID '{current_pinecone_id}'. Storing as original or skipping?")
-                 amount_num = amount # Keep original if casting fails
+        vectors_to_upsert = [record.to_upsert(embedding) for record, embedding in zip(records_to_embed, embeddings)]
 
-            try:
-                 feedback_weight_num = float(feedback_weight)
-            except (ValueError, TypeError):
-                 print(f"Warning: Could not convert feedback_weight '{feedback_weight}' to float for ID '{current_pinecone_id}'. Using default 1.0.")
-                 feedback_weight_num = 1.0
-
-            metadata = {
-                "user_id": str(user_id),
-                "ingredient": ingredient,
-                "amount": amount_num,
-                "unit": unit,
-                "servings": servings,
-                "cuisine": cuisine,
-                "feedback_weight": feedback_weight_num,
-                "original_text": taste_text
-            }
-
-            vector_to_upsert = {
-                "id": current_pinecone_id,
-                "values": embedding,
-                "metadata": metadata
-            }
-
-            # Use upsert_vectors method (it handles both insert and update based on ID)
-            # Using the modified upsert_vectors which does NOT take namespace
-            print(f"Upserting vector ID '{current_pinecone_id}' into Pinecone index '{PINECONE_INDEX_NAME}' (default namespace)...")
-            pinecone_manager.upsert_vectors([vector_to_upsert]) # Removed namespace argument
-
-
-        elif operation_type == "delete":
-             # --- DELETE HANDLING IS EXPLICITLY SKIPPED AS REQUESTED ---
-             print(f"Ignoring delete operation for ID {pinecone_id} as requested. Vector will remain in Pinecone.")
-             # --- END OF SKIPPED DELETE HANDLING ---
+        # Use upsert_vectors method (it handles both insert and update based on ID)
+        # Using the modified upsert_vectors which does NOT take namespace
+        print(f"Upserting {len(vectors_to_upsert)} vectors into Pinecone index '{PINECONE_INDEX_NAME}' (default namespace)...")
+        upserted_count = pinecone_manager.upsert_vectors(vectors_to_upsert) # Removed namespace argument
 
-        else:
-            # Handle other operation types if necessary
-            print(f"Skipping Change Event with unhandled operation type: {operation_type}")
+        # Only trust the cache for texts Pinecone has actually stored
+        if upserted_count == len(vectors_to_upsert):
+            for record in records_to_embed:
+                _remember_embedded_text(record.mongo_id, record.taste_text)
 
     except Exception as e:
-        print(f"Error processing change event for ID {pinecone_id}: {e}")
+        print(f"Error processing batch of {len(records_to_embed)} change events: {e}")
+
+
+def process_change_event(change: Dict[str, Any], pinecone_manager: PineconeManager, mongo_db: MongoClient):
+    """
+    Processes a single change event from the MongoDB Change Stream.
+    Equivalent to flushing a batch that holds just this event.
+
+    Args:
+        change: The change event dictionary.
+        pinecone_manager: The initialized PineconeManager instance.
+        mongo_db: The connected MongoDB database instance.
+    """
+    flush_change_events([change], pinecone_manager, mongo_db)
 
 
-def start_change_stream_listener():
+def start_change_stream_listener(pinecone_manager: Optional[PineconeManager] = None):
     """
     Connects to MongoDB and starts listening for Change Stream events
     on the specified collection. Upserts to Pinecone (default namespace).
     Does NOT handle delete events.
+
+    Args:
+        pinecone_manager: An already initialized PineconeManager to reuse.
+                          If omitted, the process-wide one is used.
     """
     print("Starting MongoDB Change Stream Listener (Ignoring Delete Operations)...")
 
     # --- Initialize Pinecone Manager ---
-    # PineconeManager is initialized with the embedder
-    pinecone_manager = PineconeManager(embedder=embedder)
+    # Reuse the caller's PineconeManager if one was injected
+    if pinecone_manager is None:
+        pinecone_manager = get_pinecone_manager()
 
     # Ensure Pinecone manager is initialized and connected
     if not pinecone_manager.pinecone or not pinecone_manager.index:
@@ -168,13 +218,14 @@ def start_change_stream_listener():
         print(f"Connected to MongoDB database '{MONGO_DB_NAME}' collection '{MONGO_COLLECTION_NAME}'.")
     except Exception as e:
         print(f"Error accessing MongoDB database or collection: {e}. Exiting.")
-        mongo_client.close()
+        close_mongo_client()
         return
 
 
     # --- Start Watching Change Stream ---
-    # Watch only for insert, update, replace, delete operations
-    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+    # Watch only for insert, update, replace operations. Deletes are ignored by this
+    # listener, so they are excluded server-side and never cross the wire.
+    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
 
     # Use 'fullDocument' updateLookup for update and replace operations
     change_stream_options = {'full_document': 'updateLookup'} # Corrected parameter name
@@ -183,12 +234,27 @@ def start_change_stream_listener():
 
     try:
         # Ensure MongoDB replica set is configured for Change Streams
-        with collection.watch(pipeline=pipeline, **change_stream_options) as stream:
+        # max_await_time_ms bounds how long try_next() waits on the server,
+        # so a partially filled buffer is still flushed on time.
+        with collection.watch(pipeline=pipeline, max_await_time_ms=int(CHANGE_BATCH_MAX_WAIT_SECONDS * 1000), **change_stream_options) as stream:
             print("Change stream is active and listening for events. Press Ctrl+C to stop.")
-            for change in stream:
-                process_change_event(change, pinecone_manager, mongo_db)
-                # Optional: Add a small sleep here
-                # time.sleep(0.1)
+            pending = []
+            first_pending_at = 0.0
+            try:
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        if not pending:
+                            first_pending_at = time.monotonic()
+                        pending.append(change)
+
+                    if pending and (len(pending) >= CHANGE_BATCH_MAX_SIZE
+                                    or time.monotonic() - first_pending_at >= CHANGE_BATCH_MAX_WAIT_SECONDS):
+                        flush_change_events(pending, pinecone_manager, mongo_db)
+                        pending = []
+            finally:
+                # Don't drop events that were buffered when the loop stopped
+                flush_change_events(pending, pinecone_manager, mongo_db)
 
     except KeyboardInterrupt:
         print("\nChange stream listener stopped manually.")
@@ -196,7 +262,7 @@ def start_change_stream_listener():
         print(f"\nError in change stream listener: {e}")
         print("Change stream listener stopped due to an error.")
     finally:
-        mongo_client.close()
+        close_mongo_client()
         print("MongoDB connection closed.")
 
 
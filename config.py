@@ -1,5 +1,6 @@
 # project_root/config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,14 +10,59 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME")
+# Collection holding the incremental-ingest watermark (last synced _id / updatedAt).
+INGEST_STATE_COLLECTION_NAME = os.getenv("INGEST_STATE_COLLECTION_NAME", "_ingest_state")
 
 # --- Pinecone Configuration ---
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+# Optional data-plane host of the index (shown in the Pinecone console, or logged
+# on first connect). When set, connecting skips the has_index/describe_index
+# control-plane round trips at every cold start.
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")
 
 # --- Embedding Model Configuration ---
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
+# Inference backend used by SentenceTransformer: "torch" (default) or "onnx".
+# The ONNX Runtime backend is considerably faster for CPU-only inference
+# (e.g. Lambda) and requires the optimum[onnxruntime] extras. It is opt-in per
+# deployment (function environment, or the images' EMBEDDING_BACKEND build arg,
+# which also bakes the ONNX export the backend loads).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# ONNX weights file to load, relative to the model directory, when
+# EMBEDDING_BACKEND is "onnx". Point it at a dynamically quantized INT8 export
+# (e.g. "onnx/model_qint8_avx512_vnni.onnx") for the fastest CPU inference.
+# Unset loads the default fp32 "onnx/model.onnx".
+# vector_db.embedder.export_onnx_model() writes O3-optimized and INT8 copies
+# into a local model directory (see EMBEDDING_MODEL_PATH) and returns the name to set here.
+EMBEDDING_ONNX_FILE_NAME = os.getenv("EMBEDDING_ONNX_FILE_NAME")
+# Optional local directory holding a saved copy of the embedding model (e.g. one
+# baked into the container image). When it exists it is loaded instead of
+# EMBEDDING_MODEL_NAME, skipping the Hub download; safetensors weights in it are
+# memory-mapped, so pages are only read from disk as they are used.
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+# Weight precision for the PyTorch backend: "float32" (default), "float16" or "int8".
+# float16 halves the bytes read at cold start and the resident memory.
+# int8 dynamically quantizes the Linear layers after loading, which is usually
+# the fastest option for CPU inference. With the ONNX backend, int8 loads an
+# INT8 export of the model (unless EMBEDDING_ONNX_FILE_NAME is set), creating
+# it in EMBEDDING_ONNX_CACHE_PATH the first time.
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32").lower()
+# Directory INT8 ONNX exports are cached in (must be writable; on Lambda only /tmp is).
+EMBEDDING_ONNX_CACHE_PATH = os.getenv("EMBEDDING_ONNX_CACHE_PATH", os.path.join(tempfile.gettempdir(), "onnx_embedding_model"))
+# Optimum quantization config for INT8 ONNX exports: "avx512_vnni" (x86_64 Lambda),
+# "avx2", "avx512" or "arm64" (Graviton).
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx512_vnni")
+# SQLite file used by the ingest script to cache taste_text embeddings between
+# runs, so unchanged texts are not re-embedded. Set to an empty string to disable.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+# Number of intra-op CPU threads PyTorch (and the ONNX Runtime session) may use
+# for embedding inference. Falls back to OMP_NUM_THREADS, then to every core
+# this process may run on (the CPU affinity mask, which, unlike os.cpu_count(),
+# reflects container CPU limits).
+_AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS") or os.getenv("OMP_NUM_THREADS") or _AVAILABLE_CPUS)
 
 # --- Pinecone Index Dimension ---
 # IMPORTANT: This MUST match the output dimension of your chosen embedding model.
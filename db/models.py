@@ -0,0 +1,135 @@
+# project_root/db/models.py
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union # Import for type hinting
+
+Number = Union[int, float]
+# (id, values, metadata) vector form accepted by Pinecone upserts.
+UpsertTuple = Tuple[str, Sequence[float], Dict[str, Any]]
+
+# Text embedded for a stored taste preference. Shared by every ingest path and
+# by feedback updates so stored vectors and re-embedded vectors always match.
+TASTE_TEXT_TEMPLATE = "{ingredient} {amount}{unit} for {servings} servings in {cuisine} cuisine"
+# Text embedded for a search query about one ingredient in a cuisine.
+QUERY_SUFFIX_TEMPLATE = " {cuisine} cuisine taste"
+QUERY_TEXT_TEMPLATE = "{ingredient}" + QUERY_SUFFIX_TEMPLATE
+
+
+@lru_cache(maxsize=256)
+def _query_suffix(cuisine: str) -> str:
+    """The cuisine-dependent tail of a query text, formatted once per cuisine."""
+    return QUERY_SUFFIX_TEMPLATE.format(cuisine=cuisine)
+
+
+def build_query_texts(ingredients: List[str], cuisine: str) -> List[str]:
+    """Returns the query text to embed for each ingredient, in order."""
+    # Equivalent to QUERY_TEXT_TEMPLATE.format(...) per ingredient, but the
+    # suffix is shared and each text is a single concatenation.
+    suffix = _query_suffix(cuisine)
+    return [ingredient + suffix for ingredient in ingredients]
+
+
+def _as_number(value: Any) -> Any:
+    """Returns ints/floats unchanged, casts anything else to float (raises on failure)."""
+    if isinstance(value, (int, float)):
+        return value
+    return float(value)
+
+
+@dataclass(slots=True, frozen=True)
+class TasteRecord:
+    """
+    A validated user taste preference, as stored in MongoDB and mirrored into Pinecone.
+
+    Build instances with `TasteRecord.from_mongo(doc)`; use `taste_text` as the
+    text to embed and `to_upsert(embedding)` to get the Pinecone upsert tuple.
+    """
+    mongo_id: str
+    user_id: str
+    ingredient: str
+    amount: Number
+    unit: str
+    servings: Number
+    cuisine: str
+    feedback_weight: float
+
+    @classmethod
+    def from_mongo(cls, doc: Dict[str, Any]) -> Optional["TasteRecord"]:
+        """
+        Validates a MongoDB taste document and casts its numeric fields.
+
+        Args:
+            doc: A document with user_id, ingredient, amount, servings, cuisine, _id
+                 and optionally unit and feedback_weight.
+
+        Returns:
+            A TasteRecord, or None if any required field is missing.
+        """
+        get = doc.get
+        user_id = get("user_id")
+        ingredient = get("ingredient")
+        amount = get("amount")
+        servings = get("servings")
+        cuisine = get("cuisine")
+        item_mongo_id = get("_id")
+
+        # Short-circuits on the first missing field instead of building and
+        # scanning a list of checks for every document.
+        if (user_id is None or not ingredient or amount is None or servings is None
+                or not cuisine or item_mongo_id is None):
+            return None
+
+        # Ensure amount and weight are numerical types in metadata
+        try:
+            amount = _as_number(amount)
+        except (ValueError, TypeError):
+            print(f"Warning: Could not convert amount '{amount}' to float for ID '{item_mongo_id}'. Storing as original.")
+
+        feedback_weight = get("feedback_weight", 1.0)
+        try:
+            feedback_weight = _as_number(feedback_weight)
+        except (ValueError, TypeError):
+            print(f"Warning: Could not convert feedback_weight '{feedback_weight}' to float for ID '{item_mongo_id}'. Using default 1.0.")
+            feedback_weight = 1.0
+
+        return cls(
+            mongo_id=str(item_mongo_id),
+            user_id=str(user_id),
+            ingredient=ingredient,
+            amount=amount,
+            unit=get("unit", ""),
+            servings=servings,
+            cuisine=cuisine,
+            feedback_weight=feedback_weight,
+        )
+
+    @property
+    def taste_text(self) -> str:
+        """The text that is embedded for this preference."""
+        return TASTE_TEXT_TEMPLATE.format(
+            ingredient=self.ingredient, amount=self.amount, unit=self.unit,
+            servings=self.servings, cuisine=self.cuisine
+        )
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """The Pinecone metadata stored alongside this preference's vector."""
+        return {
+            "user_id": self.user_id,
+            "ingredient": self.ingredient,
+            "amount": self.amount,
+            "unit": self.unit,
+            "servings": self.servings,
+            "cuisine": self.cuisine,
+            "feedback_weight": self.feedback_weight,
+            "original_text": self.taste_text
+        }
+
+    def to_upsert(self, embedding: Sequence[float]) -> UpsertTuple:
+        """
+        Returns the (id, values, metadata) tuple accepted by PineconeManager.upsert_vectors.
+        `embedding` may be a list or a 1-D numpy array; the Pinecone client converts it when sending.
+        """
+        # A 3-tuple is cheaper to build than an {"id", "values", "metadata"} dict
+        # and the Pinecone client accepts both forms.
+        return (self.mongo_id, embedding, self.metadata)
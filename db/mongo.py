@@ -1,20 +1,111 @@
 # project_root/db/mongo.py
-from pymongo import MongoClient
-from config import MONGO_URI, MONGO_DB_NAME, MONGO_COLLECTION_NAME
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional # Import for type hinting
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, MongoClient
+from config import MONGO_URI, MONGO_DB_NAME, MONGO_COLLECTION_NAME, INGEST_STATE_COLLECTION_NAME
+
+# A single MongoClient is shared by the whole process. MongoClient keeps a
+# thread-safe connection pool, so reusing it across requests avoids paying
+# the TCP/TLS/auth handshake on every call.
+_client = None
+_client_verified = False
+_client_lock = threading.Lock()
 
 def get_mongo_client():
-    """Establishes and returns a MongoDB client connection."""
+    """Returns the shared MongoDB client, creating and verifying it on first use."""
+    global _client, _client_verified
+    if _client is not None and _client_verified:
+        return _client
+
+    with _client_lock:
+        try:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, maxPoolSize=50, minPoolSize=5, serverSelectionTimeoutMS=5000)
+            if not _client_verified:
+                # The ismaster command is cheap and does not require auth.
+                _client.admin.command('ismaster')
+                _client_verified = True
+                print("MongoDB connection successful.")
+            return _client
+        except Exception as e:
+            print(f"MongoDB connection failed: {e}")
+            return None
+
+def close_mongo_client():
+    """Closes the shared MongoDB client. The next get_mongo_client() call reconnects."""
+    global _client, _client_verified
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_verified = False
+
+# Only the fields needed to build taste vectors are requested from MongoDB.
+# `_id` is always returned unless explicitly excluded.
+TASTE_DATA_PROJECTION = {
+    "user_id": 1,
+    "ingredient": 1,
+    "amount": 1,
+    "unit": 1,
+    "servings": 1,
+    "cuisine": 1,
+    "feedback_weight": 1,
+    "updatedAt": 1,
+}
+# Number of documents the server returns per cursor round trip.
+TASTE_DATA_BATCH_SIZE = 1000
+
+def _taste_data_filter(since_id: Optional[str] = None, since_updated_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Builds the find() filter for an incremental fetch.
+
+    New documents are picked up by `_id > since_id` (ObjectIds increase with
+    insertion time); edited documents by `updatedAt > since_updated_at`.
+    """
+    clauses = []
+    if since_id:
+        clauses.append({"_id": {"$gt": ObjectId(since_id)}})
+    if since_updated_at:
+        clauses.append({"updatedAt": {"$gt": since_updated_at}})
+
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$or": clauses}
+
+def iter_user_taste_data(client, since_id: Optional[str] = None, since_updated_at: Optional[datetime] = None):
+    """
+    Returns a lazy cursor over user taste data in the configured collection.
+
+    Documents are pulled from the server TASTE_DATA_BATCH_SIZE at a time as
+    the cursor is iterated, so memory use does not grow with the collection.
+    Only the fields in TASTE_DATA_PROJECTION are fetched.
+    Returns an empty iterator if the client is missing or the query fails.
+
+    Args:
+        client: The MongoDB client.
+        since_id: Optional ObjectId string; only documents inserted after it are returned.
+        since_updated_at: Optional datetime; documents edited after it are returned too.
+    """
+    if not client:
+        return iter(())
+
+    db = client[MONGO_DB_NAME]
+    collection = db[MONGO_COLLECTION_NAME]
+
     try:
-        client = MongoClient(MONGO_URI)
-        # The ismaster command is cheap and does not require auth.
-        client.admin.command('ismaster')
-        print("MongoDB connection successful.")
-        return client
+        query = _taste_data_filter(since_id, since_updated_at)
+        cursor = collection.find(query, projection=TASTE_DATA_PROJECTION, batch_size=TASTE_DATA_BATCH_SIZE)
+        # Ascending _id order is only needed (and only paid for) by incremental fetches
+        return cursor.sort("_id", ASCENDING) if query else cursor
     except Exception as e:
-        print(f"MongoDB connection failed: {e}")
-        return None
+        print(f"Error querying data from MongoDB: {e}")
+        return iter(())
 
-def get_user_taste_data(client):
+def get_user_taste_data(client, since_id: Optional[str] = None, since_updated_at: Optional[datetime] = None):
     """
     Fetches user taste data from the specified MongoDB collection.
 
@@ -26,9 +117,20 @@ def get_user_taste_data(client):
         "amount": ...,
         "unit": "...",
         "servings": ...,
-        "cuisine": "..."
+        "cuisine": "...",
+        "feedback_weight": ...,
+        "updatedAt": datetime (optional)
     }
+    Only the fields in TASTE_DATA_PROJECTION are fetched.
     Adjust the query/projection if your schema is different.
+
+    Args:
+        client: The MongoDB client.
+        since_id: Optional ObjectId string; only documents inserted after it are returned.
+        since_updated_at: Optional datetime; documents edited after it are returned too.
+
+    Returns:
+        A list of documents sorted by `_id` ascending (all documents if no watermark is given).
     """
     if not client:
         return []
@@ -36,12 +138,58 @@ def get_user_taste_data(client):
     db = client[MONGO_DB_NAME]
     collection = db[MONGO_COLLECTION_NAME]
 
-    # Fetch all documents. You might want to add filters here
-    # (e.g., fetch data only for users who logged in recently)
     try:
-        data = list(collection.find({}))
-        print(f"Fetched {len(data)} documents from MongoDB collection '{MONGO_COLLECTION_NAME}'.")
+        query = _taste_data_filter(since_id, since_updated_at)
+        cursor = collection.find(query, projection=TASTE_DATA_PROJECTION, batch_size=TASTE_DATA_BATCH_SIZE)
+        data = list(cursor.sort("_id", ASCENDING))
+        print(f"Fetched {len(data)} documents from MongoDB collection '{MONGO_COLLECTION_NAME}' (since_id={since_id}, since_updated_at={since_updated_at}).")
         return data
     except Exception as e:
         print(f"Error fetching data from MongoDB: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def ensure_taste_data_indexes(client):
+    """Creates the `updatedAt` index used by incremental fetches (no-op if it exists)."""
+    if not client:
+        return
+    try:
+        client[MONGO_DB_NAME][MONGO_COLLECTION_NAME].create_index([("updatedAt", ASCENDING)])
+    except Exception as e:
+        print(f"Error creating updatedAt index: {e}")
+
+# _id of the single document in INGEST_STATE_COLLECTION_NAME that holds the watermark.
+INGEST_STATE_ID = "pinecone_ingest"
+
+def get_ingest_state(client) -> Dict[str, Any]:
+    """
+    Returns the incremental-ingest watermark.
+
+    Returns:
+        A dict with "last_synced_id" (str or None) and "last_synced_at" (datetime or None).
+    """
+    state = {"last_synced_id": None, "last_synced_at": None}
+    if not client:
+        return state
+    try:
+        doc = client[MONGO_DB_NAME][INGEST_STATE_COLLECTION_NAME].find_one({"_id": INGEST_STATE_ID})
+        if doc:
+            state["last_synced_id"] = doc.get("last_synced_id")
+            state["last_synced_at"] = doc.get("last_synced_at")
+    except Exception as e:
+        print(f"Error reading ingest state from MongoDB: {e}")
+    return state
+
+def save_ingest_state(client, last_synced_id: Optional[str], last_synced_at: Optional[datetime]) -> bool:
+    """Persists the incremental-ingest watermark. Returns True on success."""
+    if not client:
+        return False
+    try:
+        client[MONGO_DB_NAME][INGEST_STATE_COLLECTION_NAME].update_one(
+            {"_id": INGEST_STATE_ID},
+            {"$set": {"last_synced_id": last_synced_id, "last_synced_at": last_synced_at}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"Error saving ingest state to MongoDB: {e}")
+        return False
@@ -1,105 +1,185 @@
 # app.py
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import sys
-import os
-import json
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import AsyncIterator, List, Optional
+import asyncio
+import orjson
+import heapq
+from operator import itemgetter
 
 # Import project modules
-from vector_db.embedder import embedder
-from vector_db.pinecone_client import PineconeManager
+from vector_db.bootstrap import get_pinecone_manager
+from vector_db.embedder_async import BatchingEmbedder
 from utils.prompt_builder import build_prompt_augmentation
-from config import PINECONE_DIMENSION, PINECONE_INDEX_NAME
+from db.models import build_query_texts
 from mangum import Mangum
 # Initialize app and PineconeManager
-app = FastAPI(title="Ingredient Recommendation API")
-pinecone_manager = PineconeManager(embedder=embedder)
+# Responses are serialized with orjson rather than the stdlib json module
+app = FastAPI(title="Ingredient Recommendation API", default_response_class=ORJSONResponse)
+pinecone_manager = get_pinecone_manager()
 
 handler= Mangum(app)
-# Input schema for the request body
+
+# Ranking key for (feedback_weight, match) pairs
+_FEEDBACK_WEIGHT_KEY = itemgetter(0)
+
+# Input schema for the request body.
+# Whitespace stripping and the required/positive checks run inside pydantic-core's
+# compiled validators, so the handler receives already-clean values.
 class IngredientRequest(BaseModel):
-    user_id: str
-    cuisine: str
-    ingredients: List[str]
-    servings: int
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True, extra='ignore')
+
+    user_id: str = Field(min_length=1)
+    cuisine: str = Field(min_length=1)
+    ingredients: List[str] = Field(min_length=1)
+    servings: int = Field(gt=0)
 
 # Output schema (optional for docs, not strictly needed)
 class PromptResponse(BaseModel):
     prompts: List[str]
     errors: Optional[List[str]] = None
 
-@app.post("/recommend", response_model=PromptResponse)
-async def recommend_ingredients(payload: IngredientRequest):
+# Minimum similarity score for a stored preference to count as a match
+MINIMUM_SIMILARITY_SCORE = 0.6
+QUERY_BATCH_SIZE = 32
+# Coalesces the query embeddings of concurrent requests into shared forward
+# passes of up to QUERY_BATCH_SIZE texts
+batching_embedder = BatchingEmbedder(pinecone_manager.embedder, max_batch_size=QUERY_BATCH_SIZE)
+
+
+async def _prepare_queries(payload: IngredientRequest):
+    """
+    Checks service readiness, drops blank ingredients and embeds every
+    ingredient query in batched forward passes.
+
+    Returns:
+        (ingredients, query_vectors), in the same order.
+    """
     if not pinecone_manager.pinecone or not pinecone_manager.index:
         raise HTTPException(status_code=500, detail="Pinecone initialization failed or index not available.")
 
     if not pinecone_manager.embedder:
         raise HTTPException(status_code=500, detail="Embedding model not available.")
 
-    user_id = payload.user_id.strip()
-    cuisine = payload.cuisine.strip()
-    ingredients = [i.strip() for i in payload.ingredients if i.strip()]
-    servings = payload.servings
+    # Items are already stripped by the model; only blank entries remain to drop
+    ingredients = [i for i in payload.ingredients if i]
 
-    if not user_id or not cuisine or not ingredients:
+    if not ingredients:
         raise HTTPException(status_code=400, detail="User ID, Cuisine, and at least one Ingredient are required.")
-    if servings <= 0:
-        raise HTTPException(status_code=400, detail="Servings must be a positive integer.")
 
-    augmented_prompts_list = []
-    errors = []
-    MINIMUM_SIMILARITY_SCORE = 0.6
+    # Embed all ingredient queries in a batched forward pass (shared with any
+    # concurrent requests) in a worker thread, instead of one encode() call
+    # per ingredient on the event loop. Queries seen before are served from
+    # the embedder's in-process cache.
+    query_texts = build_query_texts(ingredients, payload.cuisine)
+    try:
+        query_vectors = await batching_embedder.aencode_queries(query_texts)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error embedding ingredients: {str(e)}")
+
+    return ingredients, query_vectors
+
+
+def _search_ingredient(payload: IngredientRequest, ingredient: str, query_vector: List[float]):
+    """Returns an awaitable running the Pinecone search for one ingredient in a worker thread."""
+    return asyncio.to_thread(
+        pinecone_manager.search,
+        query_vector=query_vector,
+        top_k=5,
+        user_id=payload.user_id,
+        ingredient=ingredient,
+        cuisine=payload.cuisine,
+        min_score=MINIMUM_SIMILARITY_SCORE
+    )
+
+
+def _build_prompt(ingredient: str, search_results, servings: int):
+    """
+    Turns one ingredient's search results into its augmented prompt.
+
+    Returns:
+        (prompt, error): error is None on success; on failure prompt holds the error message.
+    """
+    try:
+        if isinstance(search_results, Exception):
+            raise search_results
+
+        # PineconeManager.search returns a plain list of matches
+        matches = search_results or []
+
+        # Drop low-score matches first, then keep the highest-weighted ones,
+        # so nothing destined to be filtered out is ever sorted. Each match is
+        # decorated with its weight once so the ranking key is a C-level itemgetter.
+        weighted_matches = [
+            (m['metadata']['feedback_weight'], m)
+            for m in matches if m['score'] >= MINIMUM_SIMILARITY_SCORE
+        ]
+        filtered_matches = [m for _, m in heapq.nlargest(5, weighted_matches, key=_FEEDBACK_WEIGHT_KEY)]
+
+        if not filtered_matches:
+            return f"No strong match found for '{ingredient}'", None
+
+        return build_prompt_augmentation(filtered_matches, ingredient, servings), None
+
+    except Exception as e:
+        error_msg = f"Error processing '{ingredient}': {str(e)}"
+        return error_msg, error_msg
 
-    for i, ingredient in enumerate(ingredients):
-        if not ingredient:
-            augmented_prompts_list.append(f"Error: Invalid ingredient at index {i}")
-            continue
 
-        try:
-            query_text = f"{ingredient} {cuisine} cuisine taste"
-
-            try:
-                query_vector = pinecone_manager.embedder.encode(query_text).tolist()
-            except AttributeError:
-                query_vector = pinecone_manager.embedder.encode(query_text)
-                if not isinstance(query_vector, list):
-                    augmented_prompts_list.append(f"Error embedding ingredient '{ingredient}'")
-                    continue
-
-            search_results = pinecone_manager.search(
-                query_vector=query_vector,
-                top_k=5,
-                user_id=user_id,
-                ingredient=ingredient,
-                min_score=MINIMUM_SIMILARITY_SCORE
-            )
-
-            matches = (
-                search_results.matches
-                if search_results and hasattr(search_results, 'matches') and search_results.matches is not None
-                else []
-            )
-
-            sorted_matches = sorted(
-                matches, key=lambda x: x['metadata']['feedback_weight'], reverse=True
-            )
-            filtered_matches = [m for m in sorted_matches if m['score'] >= MINIMUM_SIMILARITY_SCORE]
-
-            if not filtered_matches:
-                augmented_prompts_list.append(f"No strong match found for '{ingredient}'")
-                continue
-
-            prompt = build_prompt_augmentation(filtered_matches, ingredient, servings)
-            augmented_prompts_list.append(prompt)
+@app.post("/recommend", response_model=PromptResponse)
+async def recommend_ingredients(payload: IngredientRequest):
+    ingredients, query_vectors = await _prepare_queries(payload)
 
-        except Exception as e:
-            error_msg = f"Error processing '{ingredient}': {str(e)}"
-            errors.append(error_msg)
-            augmented_prompts_list.append(error_msg)
+    # Pinecone searches are independent network round trips, so run them
+    # concurrently in worker threads instead of awaiting them one by one.
+    search_tasks = [
+        _search_ingredient(payload, ingredient, query_vector)
+        for ingredient, query_vector in zip(ingredients, query_vectors)
+    ]
+    all_search_results = await asyncio.gather(*search_tasks, return_exceptions=True)
+
+    augmented_prompts_list = []
+    errors = []
+    for ingredient, search_results in zip(ingredients, all_search_results):
+        prompt, error = _build_prompt(ingredient, search_results, payload.servings)
+        augmented_prompts_list.append(prompt)
+        if error:
+            errors.append(error)
 
     return {
         "prompts": augmented_prompts_list,
         "errors": errors if errors else None
     }
+
+
+@app.post("/recommend/stream")
+async def recommend_ingredients_stream(payload: IngredientRequest):
+    """
+    Streaming variant of /recommend: writes one NDJSON line
+    {"ingredient", "prompt", "error"} per ingredient as soon as its search
+    completes, so the first result arrives after the fastest search rather
+    than the slowest.
+
+    Streaming needs a server that forwards chunks as they are produced
+    (uvicorn, or Lambda behind a response-streaming web adapter); Mangum
+    buffers the whole body into one response.
+    """
+    ingredients, query_vectors = await _prepare_queries(payload)
+
+    async def search_one(ingredient, query_vector):
+        try:
+            search_results = await _search_ingredient(payload, ingredient, query_vector)
+        except Exception as e:
+            search_results = e
+        return ingredient, search_results
+
+    async def stream_prompts() -> AsyncIterator[bytes]:
+        pending = [search_one(ingredient, query_vector) for ingredient, query_vector in zip(ingredients, query_vectors)]
+        for completed in asyncio.as_completed(pending):
+            ingredient, search_results = await completed
+            prompt, error = _build_prompt(ingredient, search_results, payload.servings)
+            yield orjson.dumps({"ingredient": ingredient, "prompt": prompt, "error": error}) + b"\n"
+
+    return StreamingResponse(stream_prompts(), media_type="application/x-ndjson")
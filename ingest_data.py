@@ -1,126 +1,240 @@
-from db.mongo import get_mongo_client, get_user_taste_data
-from vector_db.embedder import embedder # Import the embedder instance
-from vector_db.pinecone_client import PineconeManager # Import the class
-from config import PINECONE_DIMENSION # Useful to confirm dimension alignment
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional # Import for type hinting
+from db.mongo import (get_mongo_client, iter_user_taste_data, close_mongo_client,
+                      ensure_taste_data_indexes, get_ingest_state, save_ingest_state)
+from vector_db.bootstrap import get_pinecone_manager # Shared PineconeManager (and embedder)
+from vector_db.embedding_cache import EmbeddingCache
+from config import EMBEDDING_CACHE_PATH
 from bson.objectid import ObjectId # Import ObjectId
+from db.models import TasteRecord
+from utils.batching import chunked
+
+# Per-document detail is logged at DEBUG so large ingests don't pay for a
+# stdout write (and, on Lambda, a CloudWatch log line) per document.
+logger = logging.getLogger(__name__)
+
+# Number of MongoDB documents read, embedded and upserted together.
+INGEST_CHUNK_SIZE = 100
+# Maximum number of chunks buffered between two pipeline stages. Bounds memory
+# (and lets a slow stage apply back-pressure to the ones before it).
+PIPELINE_QUEUE_SIZE = 4
+# A progress line is logged every this many documents.
+PROGRESS_LOG_INTERVAL = 500
+# Put on a queue by a stage when it has no more work for the next one.
+_END_OF_STREAM = object()
+
+
+@dataclass(slots=True)
+class _IngestProgress:
+    """Counters and watermark shared by the pipeline stages of one ingest run."""
+    last_synced_at: Optional[datetime]
+    documents_seen: int = 0
+    records_prepared: int = 0
+    vectors_upserted: int = 0
+    max_id: Optional[ObjectId] = None
+    failed: bool = False
+
+
+def _read_chunks(cursor, out_queue: queue.Queue, progress: _IngestProgress):
+    """
+    Producer stage: reads the MongoDB cursor INGEST_CHUNK_SIZE documents at a
+    time and tracks the watermark of everything read.
+    """
+    try:
+        for chunk in chunked(cursor, INGEST_CHUNK_SIZE):
+            progress.documents_seen += len(chunk)
+            for item in chunk:
+                item_id = item.get("_id")
+                if item_id is not None and (progress.max_id is None or item_id > progress.max_id):
+                    progress.max_id = item_id
+                updated_at = item.get("updatedAt")
+                if updated_at and (progress.last_synced_at is None or updated_at > progress.last_synced_at):
+                    progress.last_synced_at = updated_at
+            out_queue.put(chunk)
+    except Exception as e:
+        logger.error("Error reading taste data from MongoDB: %s", e)
+        progress.failed = True
+    finally:
+        out_queue.put(_END_OF_STREAM)
+
+
+def _embed_texts(texts, pinecone_manager, embedding_cache: Optional[EmbeddingCache]):
+    """
+    Returns one embedding per text, in order. Texts found in `embedding_cache`
+    are not re-embedded; the remaining distinct texts are encoded in one
+    batched call and added to the cache.
+    """
+    if embedding_cache is None:
+        return pinecone_manager.embedder.encode(
+            texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True, as_numpy=True
+        )
+
+    vectors_by_text = embedding_cache.get_many(texts)
+    miss_texts = list(dict.fromkeys(text for text in texts if text not in vectors_by_text))
+    logger.debug("Embedding cache: %d hits, %d misses", len(texts) - len(miss_texts), len(miss_texts))
+    if miss_texts:
+        new_vectors = pinecone_manager.embedder.encode(
+            miss_texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True, as_numpy=True
+        )
+        embedding_cache.put_many(zip(miss_texts, new_vectors))
+        vectors_by_text.update(zip(miss_texts, new_vectors))
+    return [vectors_by_text[text] for text in texts]
+
+
+def _embed_chunks(in_queue: queue.Queue, out_queue: queue.Queue, pinecone_manager, progress: _IngestProgress,
+                  embedding_cache: Optional[EmbeddingCache] = None):
+    """
+    Embedding stage: validates each chunk into TasteRecords, embeds their texts
+    in one batched call (reusing cached embeddings) and passes the
+    upsert-format vectors on.
+    A failed chunk is recorded and skipped so the stages around it keep draining.
+    """
+    documents_done = 0
+    try:
+        while (chunk := in_queue.get()) is not _END_OF_STREAM:
+            # Pass 1: validate documents into TasteRecords
+            records = []
+            for item in chunk:
+                try:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Processing item ID: %s, amount (raw): %r, feedback_weight (raw): %r",
+                                     item.get('_id'), item.get('amount'), item.get('feedback_weight'))
+
+                    # Validate required fields and cast amount/weight to numbers
+                    record = TasteRecord.from_mongo(item)
+                    if record is None:
+                         continue
+                    records.append(record)
+
+                except Exception as e:
+                    logger.warning("Error processing document with _id %s: %s", item.get('_id'), e)
+                    continue
+
+            documents_done += len(chunk)
+            if documents_done // PROGRESS_LOG_INTERVAL > (documents_done - len(chunk)) // PROGRESS_LOG_INTERVAL:
+                logger.info("Processed %d documents", documents_done)
+
+            if not records:
+                continue
+            progress.records_prepared += len(records)
+
+            # Pass 2: embed every taste_text in batched forward passes
+            # instead of one forward pass per document
+            try:
+                embeddings = _embed_texts([record.taste_text for record in records], pinecone_manager, embedding_cache)
+                out_queue.put([record.to_upsert(embedding) for record, embedding in zip(records, embeddings)])
+            except Exception as e:
+                logger.error("Error embedding %d documents: %s", len(records), e)
+                progress.failed = True
+    finally:
+        out_queue.put(_END_OF_STREAM)
+
+
+def _upsert_chunks(in_queue: queue.Queue, pinecone_manager, progress: _IngestProgress):
+    """Upsert stage: writes each embedded chunk to Pinecone (default namespace)."""
+    while (vectors_to_upsert := in_queue.get()) is not _END_OF_STREAM:
+        upserted_count = pinecone_manager.upsert_vectors(vectors_to_upsert) # Using default namespace
+        progress.vectors_upserted += upserted_count
+        if upserted_count != len(vectors_to_upsert):
+            progress.failed = True
+
 
 def ingest_data_to_pinecone():
     """
     Loads user taste data from MongoDB, embeds it, and upserts it to Pinecone.
+
+    Runs as a three-stage pipeline: a reader thread streams the MongoDB
+    cursor, an embedding thread encodes each chunk, and the calling thread
+    upserts it. Bounded queues between the stages let Mongo reads, embedding
+    compute and Pinecone writes overlap instead of running back to back.
     """
-    print("Starting data ingestion process...")
+    logger.info("Starting data ingestion process...")
 
     # --- Initialize Pinecone Manager ---
-    # Initialize PineconeManager with the embedder instance
-    pinecone_manager = PineconeManager(embedder=embedder)
+    # Get the process-wide PineconeManager (created with the embedder on first use)
+    pinecone_manager = get_pinecone_manager()
 
     # Ensure Pinecone manager is initialized and connected to the index
     if not pinecone_manager.pinecone or not pinecone_manager.index:
-        print("\nPinecone initialization failed or index not available. Cannot perform ingestion. Exiting.")
+        logger.error("Pinecone initialization failed or index not available. Cannot perform ingestion. Exiting.")
+        return
+
+    if not pinecone_manager.embedder:
+        logger.error("Embedding model not available in PineconeManager. Cannot prepare data for upsert. Exiting.")
         return
 
     # --- Load data from MongoDB ---
-    print("\n--- Loading data from MongoDB ---")
+    logger.info("Loading data from MongoDB")
     mongo_client = get_mongo_client()
     if not mongo_client:
-        print("Failed to connect to MongoDB. Cannot load data for ingestion. Exiting.")
+        logger.error("Failed to connect to MongoDB. Cannot load data for ingestion. Exiting.")
         return
 
-    # --- Implement Efficient Update Strategy Here ---
-    # Currently, this fetches the first 100. For efficiency, modify get_user_taste_data
-    # or add logic here to fetch only new/updated documents (e.g., based on timestamp).
-    # For this example, we'll fetch the first 100 as in the original code for demonstration.
-    user_taste_data = get_user_taste_data(mongo_client)
-    mongo_client.close() # Close the connection after fetching
-
-    if not user_taste_data:
-        print("No taste data found in MongoDB or fetched for ingestion.")
-    else:
-        print(f"Successfully loaded {len(user_taste_data)} documents from MongoDB.")
-
-    # --- Prepare data for Pinecone (Embed and Format) ---
-    vectors_to_upsert = []
-    if user_taste_data:
-        print("\n--- Preparing data for Pinecone upsert ---")
-        if not pinecone_manager.embedder:
-             print("Embedding model not available in PineconeManager. Cannot prepare data for upsert. Skipping upsert step.")
-        else:
-            for item in user_taste_data:
-                try:
-                    # Safely extract fields, matching the structure you provided
-                    user_id = item.get("user_id")
-                    ingredient = item.get("ingredient")
-                    amount = item.get("amount")
-                    servings = item.get("servings")
-                    cuisine = item.get("cuisine")
-                    item_mongo_id = item.get("_id")
-
-                    unit = item.get("unit", "")
-                    feedback_weight = item.get("feedback_weight", 1.0)
-
-                    print(f"Ingestion: Processing item ID: {item.get('_id')}")
-                    print(f"Ingestion: Amount (raw): {item.get('amount')}, Type: {type(item.get('amount'))}")
-                    print(f"Ingestion: Feedback Weight (raw): {item.get('feedback_weight')}, Type: {type(item.get('feedback_weight'))}")
-                    
-                    if not all([user_id is not None, ingredient, amount is not None, servings is not None, cuisine, item_mongo_id]):
-                         continue
-
-                    pinecone_id = str(item_mongo_id)
-                    taste_text = f"{ingredient} {amount}{unit} for {servings} servings in {cuisine} cuisine"
-
-                    # Use the embedder instance from the pinecone_manager
-                    # Ensure .tolist() is used ONLY if self.embedder.encode returns a numpy array.
-                    # Added error handling for AttributeError if it's already a list.
-                    try:
-                        embedding = pinecone_manager.embedder.encode(taste_text).tolist()
-                    except AttributeError:
-                         embedding = pinecone_manager.embedder.encode(taste_text)
-                         if not isinstance(embedding, list):
-                             print(f"Warning: Embedder did not return a list or numpy array for ID '{pinecone_id}'. Skipping document.")
-                             continue # Skip this document if embedding is invalid
-
-
-                    metadata = {
-                        "user_id": str(user_id),
-                        "ingredient": ingredient,
-                        "amount": amount,
-                        "unit": unit,
-                        "servings": servings,
-                        "cuisine": cuisine,
-                        "feedback_weight": feedback_weight,
-                        "original_text": taste_text
-                    }
-
-                    vectors_to_upsert.append({
-                        "id": pinecone_id,
-                        "values": embedding,
-                        "metadata": metadata
-                    })
-
-                except Exception as e:
-                    print(f"Error processing document with _id {item.get('_id')}: {e}")
-                    continue
-
-            print(f"Prepared {len(vectors_to_upsert)} vectors for upsert.")
-
-    # --- Upsert data into Pinecone ---
-    if vectors_to_upsert:
-        # Ensure Pinecone index is available before attempting upsert
-        if pinecone_manager.index:
-            print("\n--- Upserting data into Pinecone ---")
-            # Use the upsert_vectors method of the pinecone_manager
-            # Add namespace if you are using one (e.g., namespace="user_tastes")
-            pinecone_manager.upsert_vectors(vectors_to_upsert) # Using default namespace
-        else:
-            print("\nPinecone index not available for upsert. Skipping upsert.")
+    # --- Incremental fetch ---
+    # Only documents inserted (_id) or edited (updatedAt) since the last
+    # successful run are fetched, so unchanged records are not re-embedded.
+    ensure_taste_data_indexes(mongo_client)
+    ingest_state = get_ingest_state(mongo_client)
+    cursor = iter_user_taste_data(
+        mongo_client,
+        since_id=ingest_state["last_synced_id"],
+        since_updated_at=ingest_state["last_synced_at"]
+    )
+
+    # Unchanged taste texts reuse the embedding stored by an earlier run
+    embedding_cache = None
+    if EMBEDDING_CACHE_PATH:
+        try:
+            embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        except Exception as e:
+            logger.warning("Embedding cache unavailable (%s). Embedding every document.", e)
+
+    # --- Stream, embed and upsert ---
+    logger.info("Streaming data from MongoDB into Pinecone")
+    # Both watermarks start from the stored ones, so a run that only picks up
+    # edited older documents never moves the _id watermark backwards.
+    progress = _IngestProgress(
+        last_synced_at=ingest_state["last_synced_at"],
+        max_id=ObjectId(ingest_state["last_synced_id"]) if ingest_state["last_synced_id"] else None
+    )
+    documents_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    vectors_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stages = [
+        threading.Thread(target=_read_chunks, args=(cursor, documents_queue, progress), daemon=True),
+        threading.Thread(target=_embed_chunks, args=(documents_queue, vectors_queue, pinecone_manager, progress, embedding_cache), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+    _upsert_chunks(vectors_queue, pinecone_manager, progress)
+    for stage in stages:
+        stage.join()
+
+    logger.info("Processed %d documents; prepared %d records; upserted %d vectors.",
+                progress.documents_seen, progress.records_prepared, progress.vectors_upserted)
+
+    # --- Advance the watermark only after a fully successful run ---
+    if not progress.documents_seen:
+        logger.info("No new or updated taste data found in MongoDB for ingestion.")
+    elif progress.failed:
+        logger.warning("Ingest watermark not advanced; the next run will retry these documents.")
     else:
-        if user_taste_data:
-            print("No valid data to upsert into Pinecone (data preparation failed or yielded no valid vectors).")
-        else:
-            print("No valid data to upsert into Pinecone (no data loaded from MongoDB).")
+        # Documents that failed validation are advanced past too, so they are
+        # not re-read until they are edited (which bumps updatedAt).
+        if save_ingest_state(mongo_client, str(progress.max_id), progress.last_synced_at):
+            logger.info("Ingest watermark advanced to _id %s, updatedAt %s.", progress.max_id, progress.last_synced_at)
 
+    # The cursor is exhausted once the reader stage has finished
+    close_mongo_client()
+    if embedding_cache is not None:
+        embedding_cache.close()
 
-    print("\nData ingestion process finished.")
+    logger.info("Data ingestion process finished.")
 
 if __name__ == "__main__":
-    ingest_data_to_pinecone()
\ No newline at end of file
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ingest_data_to_pinecone()
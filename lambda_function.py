@@ -1,316 +1,483 @@
 # project_root/lambda_function.py (or api/search.py)
-import json
+import logging
 import os
+import threading
+from typing import Any, List, Literal, Optional
+import orjson
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+from pydantic_core import PydanticCustomError
 
 # Import your project modules
-from vector_db.embedder import embedder
-from vector_db.pinecone_client import PineconeManager
+from vector_db.bootstrap import get_pinecone_manager
 # Import the updated prompt_builder function (expects list of matches and queried ingredient, and user servings)
-from utils.prompt_builder import build_prompt_augmentation
+from utils.prompt_builder import build_prompt_augmentation_batch
+from db.models import build_query_texts
 # config is implicitly available via os.getenv, but can be imported if needed directly
 # from config import ...
 
+# Log calls use %-style arguments, so a message is only formatted when its
+# level is enabled. LOG_LEVEL defaults to WARNING: on the happy path no
+# request-level message is built at all. (The Lambda runtime's root handler
+# writes enabled records to CloudWatch.)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+
+
+def _dumps(obj) -> str:
+    """
+    Serializes a response body with orjson (numpy values included); API Gateway
+    expects a str body. Any other type orjson can't handle natively (e.g. a
+    value carried over from Pinecone metadata) is rendered with str() rather
+    than failing the whole response.
+    """
+    return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def _warm_up(manager):
+    """
+    Runs one throwaway embedding and one filtered Pinecone query during init,
+    so the first real request doesn't pay for first-call kernel setup, weight
+    page-in, or the gRPC channel / TLS handshake. Failures are only logged.
+    """
+    try:
+        warmup_vector = manager.embedder.encode("warmup")
+        # No user has this ID, so Pinecone returns no matches
+        manager.search(query_vector=warmup_vector, top_k=1, filter={"user_id": "__warmup__"})
+        logger.info("Warmup complete.")
+    except Exception as e:
+        logger.warning("Warmup failed (continuing): %s", e)
+
+
 # --- Initialize components outside the handler ---
 pinecone_manager = None
 is_initialized = False
 initialization_error = None
-
+_init_attempted = False
+_init_lock = threading.Lock()
+
+def _get_manager():
+    """
+    Initializes PineconeManager exactly once per execution environment and
+    returns it (None if initialization failed).
+
+    Double-checked under _init_lock so that, should initialization ever be
+    entered twice concurrently, only one caller constructs the manager; the
+    unlocked fast path keeps warm invocations free of lock traffic.
+    """
+    global pinecone_manager, is_initialized, initialization_error, _init_attempted
+    if _init_attempted:
+        return pinecone_manager
+
+    with _init_lock:
+        if _init_attempted:
+            return pinecone_manager
+        try:
+            logger.info("Lambda function initializing...")
+            # Get the process-wide PineconeManager (created with the embedder on first use)
+            pinecone_manager = get_pinecone_manager()
+            is_initialized = True
+            logger.info("Lambda function initialized successfully.")
+            # Runs once per cold start; warm invocations skip it
+            if pinecone_manager.index and pinecone_manager.embedder:
+                _warm_up(pinecone_manager)
+        except Exception as e:
+            logger.error("Lambda function initialization failed: %s", e)
+            # Store the error to report it on subsequent requests
+            initialization_error = str(e)
+            is_initialized = False # Ensure flag is False
+        finally:
+            _init_attempted = True
+        return pinecone_manager
+
+# Initialize during the Lambda init phase rather than in the first request
+_get_manager()
+
+# With SnapStart the initialized process (imported torch, loaded and warmed-up
+# model) is snapshotted once per published version, and cold starts restore it
+# instead of re-running the init above. snapshot_restore_py is only provided by
+# the managed Python runtime; container images and local runs skip this.
 try:
-    print("Lambda function initializing...")
-    # Initialize PineconeManager with the embedder instance
-    pinecone_manager = PineconeManager(embedder=embedder)
-    is_initialized = True
-    print("Lambda function initialized successfully.")
-except Exception as e:
-    print(f"Lambda function initialization failed: {e}")
-    # Store the error to report it on subsequent requests
-    initialization_error = str(e)
-    is_initialized = False # Ensure flag is False
-
-
-# --- AWS Lambda Handler Function ---
-# This function is the entry point for Lambda invocations (triggered by API Gateway etc.)
-# It now handles different paths for search and update operations.
-def lambda_handler(event, context):
-    # Check if initialization was successful
-    if not is_initialized:
+    from snapshot_restore_py import register_after_restore
+except ImportError:
+    register_after_restore = None
+
+if register_after_restore is not None:
+    @register_after_restore
+    def _after_snapshot_restore():
+        """Reopens the Pinecone channel, which does not survive a snapshot restore."""
+        if pinecone_manager is not None:
+            pinecone_manager.reconnect_index()
+
+
+# --- Request Schemas ---
+# The required/type/positive checks run inside pydantic-core's compiled
+# validators in one pass, instead of a chain of .get()/isinstance/int() checks.
+
+def _user_id_to_str(value):
+    """Accepts numeric user IDs (e.g. 42) and handles them as strings ("42")."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+class SearchRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
+    user_id: str = Field(min_length=1)
+    cuisine: str = Field(min_length=1)
+    # Items are checked per ingredient by the handler, so one bad entry only
+    # fails its own slot of the response instead of the whole request.
+    ingredients: List[Any] = Field(min_length=1)
+    servings: int = Field(gt=0)
+
+    _coerce_user_id = field_validator('user_id', mode='before')(_user_id_to_str)
+
+    @field_validator('servings', mode='before')
+    @classmethod
+    def _servings_to_int(cls, value):
+        """Converts servings with int(), so "3", 3.0 and 3.7 are all accepted as before."""
+        if value is None:
+            return value # Reported as a missing parameter, not as a bad servings value
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            raise PydanticCustomError('servings_not_integer', 'Servings must be an integer')
+
+
+class UpdateRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
+    user_id: str = Field(min_length=1)
+    cuisine: str = Field(min_length=1)
+    ingredient: str = Field(min_length=1)
+    feedback: Literal["more", "less", "perfect"]
+    # ID of the preference vector (returned by an earlier update); lets the
+    # update fetch it directly instead of searching for it
+    pinecone_id: Optional[str] = None
+
+    _coerce_user_id = field_validator('user_id', mode='before')(_user_id_to_str)
+
+
+# Validation error bodies never change, so they are serialized once at import.
+SEARCH_INVALID_PARAMS_BODY = _dumps({'error': 'Missing or invalid required parameters for search. Expecting user_id (string), cuisine (string), ingredients (non-empty list of strings), and servings (number).'})
+SEARCH_INVALID_SERVINGS_BODY = _dumps({'error': 'Invalid servings value for search. Must be a positive integer.'})
+SEARCH_NON_INTEGER_SERVINGS_BODY = _dumps({'error': 'Invalid servings value for search. Must be an integer.'})
+# Body for a request whose only problem is its servings value, keyed by the
+# pydantic error type; a missing or null servings is a missing parameter.
+SEARCH_SERVINGS_ERROR_BODIES = {
+    'servings_not_integer': SEARCH_NON_INTEGER_SERVINGS_BODY,
+    'greater_than': SEARCH_INVALID_SERVINGS_BODY,
+}
+UPDATE_INVALID_PARAMS_BODY = _dumps({'error': "Missing or invalid required parameters for update. Expecting user_id (string), cuisine (string), ingredient (string), and feedback (one of ['more', 'less', 'perfect'])."})
+
+
+# --- Request Handlers ---
+# Each handler receives the already-parsed JSON body and the response headers,
+# and returns the complete API Gateway proxy response.
+
+def handle_search(request_body, headers):
+    """
+    Handles POST /search: embeds each ingredient, searches the user's taste
+    preferences and returns one augmented prompt per ingredient.
+
+    Expects a JSON body like:
+    { "user_id": "...", "cuisine": "...", "ingredients": ["...", "..."], "servings": ... }
+    """
+    logger.debug("Handling Search Request...")
+    # Basic input validation for search
+    try:
+        search_request = SearchRequest.model_validate(request_body)
+    except ValidationError as e:
+        validation_errors = e.errors()
+        if all(error['loc'][:1] == ('servings',) for error in validation_errors):
+            body = SEARCH_SERVINGS_ERROR_BODIES.get(validation_errors[0]['type'], SEARCH_INVALID_PARAMS_BODY)
+        else:
+            body = SEARCH_INVALID_PARAMS_BODY
         return {
-            'statusCode': 500,
-            'headers': { 'Content-Type': 'application/json' },
-            'body': json.dumps({'error': 'Service failed to initialize', 'details': initialization_error})
+            'statusCode': 400,
+             'headers': headers,
+            'body': body
         }
 
-    # Ensure Pinecone index and embedder are ready (double-check after init)
-    if not pinecone_manager.index:
-         return {
-            'statusCode': 500,
-             'headers': { 'Content-Type': 'application/json' },
-            'body': json.dumps({'error': 'Pinecone index not available'})
-         }
-    if not pinecone_manager.embedder:
-         return {
-            'statusCode': 500,
-             'headers': { 'Content-Type': 'application/json' },
-            'body': json.dumps({'error': 'Embedding model not available'})
-         }
-
-    # --- Determine the operation based on the request path ---
-    # API Gateway typically puts the path in event['path'] or event['resource']
-    # event['path'] includes the stage (e.g., '/default/search')
-    # event['resource'] is the path template (e.g., '/search')
-    # Using event['path'] for simplicity, assuming a structure like /<stage>/<operation>
-    request_path = event.get('path', '').lower()
+    user_id = search_request.user_id
+    cuisine = search_request.cuisine
+    ingredient_list = search_request.ingredients
+    user_servings_int = search_request.servings
+
+    logger.info("Search Request: User ID: %s, Cuisine: '%s', Ingredients: %s, Servings: %s",
+                user_id, cuisine, ingredient_list, user_servings_int)
+
+    # --- Process Each Ingredient and Perform Search ---
+    # Pre-sized so every result (or error) lands at its ingredient's index
+    augmented_prompts_list = [None] * len(ingredient_list)
+    errors = []
+
+    # Define the minimum similarity score for this search
+    MINIMUM_SIMILARITY_SCORE = 0.7 # You can make this configurable if needed
+    QUERY_BATCH_SIZE = 32
+    # Ingredients embedded per pipeline step; short lists run as a single step
+    PIPELINE_SUB_BATCH_SIZE = 16
+
+    # One validation pass: invalid entries are answered in place, valid ones
+    # keep their index for the result loop below.
+    valid_positions = []
+    for i, ingredient in enumerate(ingredient_list):
+        if isinstance(ingredient, str) and ingredient.strip():
+            valid_positions.append(i)
+        else:
+            logger.info("Skipping invalid ingredient at index %d: '%s'", i, ingredient)
+            augmented_prompts_list[i] = f"Error: Invalid ingredient at index {i}"
+
+    # Repeated ingredients (e.g. ["onion", "onion", "garlic"]) are embedded,
+    # searched and turned into a prompt once, then copied to every position.
+    # Matching is exact, like the Pinecone ingredient filter.
+    unique_ingredients = list(dict.fromkeys(ingredient_list[i] for i in valid_positions))
+
+    # --- Embed and search the distinct ingredients in pipelined sub-batches ---
+    # Each sub-batch is embedded in one padded forward pass (queries seen on
+    # earlier warm invocations come from the embedder's cache), and its Pinecone
+    # queries are put in flight over the gRPC channel before the next sub-batch
+    # is embedded, so embedding compute overlaps the network round trips.
+    pending_searches = [] # (ingredients, collect function) per dispatched sub-batch
+    embedding_errors = {} # ingredient -> error message, for sub-batches that failed to embed
+    for start in range(0, len(unique_ingredients), PIPELINE_SUB_BATCH_SIZE):
+        sub_batch = unique_ingredients[start:start + PIPELINE_SUB_BATCH_SIZE]
+        try:
+            query_vectors = pinecone_manager.embedder.encode_queries(
+                build_query_texts(sub_batch, cuisine), batch_size=QUERY_BATCH_SIZE
+            )
+        except Exception as e:
+            logger.error("Error embedding ingredients for search: %s", e)
+            # Reported once per affected ingredient position by the loops below
+            embedding_errors.update(dict.fromkeys(sub_batch, f"Error embedding ingredients: {str(e)}"))
+            continue
+        pending_searches.append((sub_batch, pinecone_manager.start_batch_search(
+            query_vectors=query_vectors,
+            ingredients=sub_batch, # Each query is filtered on its own ingredient
+            top_k=5, # Retrieve up to 5 matches for this ingredient/user (after filtering/thresholding)
+            user_id=user_id,       # Pass the user_id for filtering
+            cuisine=cuisine,       # Pass the cuisine so Pinecone scores fewer candidates
+            min_score=MINIMUM_SIMILARITY_SCORE # Pass the minimum score threshold
+            # namespace="" # Add namespace if using
+        )))
+
+    search_results_by_ingredient = {}
+    for sub_batch, collect_results in pending_searches:
+        search_results_by_ingredient.update(zip(sub_batch, collect_results()))
+
+    # (prompt or error entry, error message or None) per distinct ingredient
+    results_by_ingredient = {}
+    # Matches (already filtered and thresholded by Pinecone) per ingredient
+    # that has search results, in ingredient order
+    matches_by_ingredient = {}
+    for ingredient in unique_ingredients:
+        search_results_list = search_results_by_ingredient.get(ingredient)
+        if search_results_list is None:
+             results_by_ingredient[ingredient] = (f"Error embedding ingredient '{ingredient}'", embedding_errors.get(ingredient, f"Error embedding ingredient '{ingredient}'"))
+             continue
+
+        # --- Debug logging for search_results_list (skipped unless DEBUG is enabled) ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Processing ingredient '%s' for search...", ingredient)
+            logger.debug("After pinecone_manager.search for '%s': %d matches found", ingredient, len(search_results_list))
+            if search_results_list:
+                logger.debug("First match object preview: %s", search_results_list[0])
+        # --- End Debug logging ---
+
+        matches_by_ingredient[ingredient] = search_results_list
+
+    # --- Build every ingredient's prompt in one call ---
+    # Each prompt uses only the top match of its ingredient; an ingredient that
+    # fails is reported on its own without affecting the others.
+    prompts_by_ingredient, failures_by_ingredient = build_prompt_augmentation_batch(matches_by_ingredient, user_servings_int)
+    for ingredient, prompt_augmentation_string in prompts_by_ingredient.items():
+        results_by_ingredient[ingredient] = (prompt_augmentation_string, None)
+    for ingredient, e in failures_by_ingredient.items():
+        logger.error("Error processing ingredient '%s' for user '%s': %s", ingredient, user_id, e)
+        results_by_ingredient[ingredient] = (f"Error processing '{ingredient}'", f"Error processing '{ingredient}': {str(e)}")
+
+    # Store the result for each ingredient at its position(s); errors are
+    # still counted per position so the response status is unchanged.
+    for i in valid_positions:
+        augmented_prompts_list[i], error_message = results_by_ingredient[ingredient_list[i]]
+        if error_message:
+            errors.append(error_message)
+
+    # --- Return Search Response ---
+    response_body = {
+        'user_id': user_id,
+        'cuisine': cuisine,
+        'ingredients_processed': ingredient_list,
+        'user_servings': user_servings_int, # Include user servings in response
+        'augmented_prompts': augmented_prompts_list,
+        'status': 'success' if not errors else ('partial_success' if len(errors) < len(ingredient_list) else 'failure'),
+        'errors': errors
+    }
 
-    # Include CORS headers in all responses
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*', # Be specific about your frontend domain in production
-        'Access-Control-Allow-Headers': 'Content-Type',
-        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET' # Allow methods used by both paths
+    return {
+        'statusCode': 200 if not errors else (207 if len(errors) < len(ingredient_list) else 500),
+        'headers': headers,
+        'body': _dumps(response_body)
     }
 
 
-    # --- Handle Search Operation ---
-    # Assuming the search path is something like /<stage>/search
-    if '/search' in request_path and event.get('httpMethod') == 'POST':
-        print("Handling Search Request...")
-        # --- Parse Request Input for Search ---
-        # Expecting a POST request with a JSON body like:
-        # { "user_id": "...", "cuisine": "...", "ingredients": ["...", "..."], "servings": ... }
-        try:
-            if event.get('body'):
-                 request_body = json.loads(event['body'])
-                 user_id = request_body.get('user_id')
-                 cuisine = request_body.get('cuisine')
-                 ingredient_list = request_body.get('ingredients') # Expecting a list
-                 user_servings = request_body.get('servings') # Get the user-provided servings
-            else:
-                 return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Missing request body for search. Expecting POST with JSON body.'})
-                 }
-
-            # Basic input validation for search
-            if not user_id or not cuisine or not isinstance(ingredient_list, list) or not ingredient_list or user_servings is None:
-                return {
-                    'statusCode': 400,
-                     'headers': headers,
-                    'body': json.dumps({'error': 'Missing or invalid required parameters for search. Expecting user_id (string), cuisine (string), ingredients (non-empty list of strings), and servings (number).'})
-                }
-
-            # Validate servings is a positive number
-            try:
-                 user_servings_int = int(user_servings)
-                 if user_servings_int <= 0:
-                      return {
-                         'statusCode': 400,
-                          'headers': headers,
-                         'body': json.dumps({'error': 'Invalid servings value for search. Must be a positive integer.'})
-                      }
-            except (ValueError, TypeError):
-                 return {
-                    'statusCode': 400,
-                     'headers': headers,
-                    'body': json.dumps({'error': 'Invalid servings value for search. Must be an integer.'})
-                 }
-
-            print(f"Search Request: User ID: {user_id}, Cuisine: '{cuisine}', Ingredients: {ingredient_list}, Servings: {user_servings_int}")
-
-        except json.JSONDecodeError:
-             print("Error decoding JSON body for search.")
-             return {
-                 'statusCode': 400,
-                  'headers': headers,
-                 'body': json.dumps({'error': 'Invalid JSON body for search'})
-             }
-        except Exception as e:
-             print(f"Error parsing search request input: {e}")
-             return {
-                 'statusCode': 400,
-                  'headers': headers,
-                 'body': json.dumps(f"Error processing search input: {str(e)}")
-             }
-
-        # --- Process Each Ingredient and Perform Search ---
-        augmented_prompts_list = []
-        errors = []
-
-        # Define the minimum similarity score for this search
-        MINIMUM_SIMILARITY_SCORE = 0.7 # You can make this configurable if needed
-
-        for i, ingredient in enumerate(ingredient_list):
-            if not isinstance(ingredient, str) or not ingredient.strip():
-                 print(f"Skipping invalid ingredient at index {i}: '{ingredient}'")
-                 augmented_prompts_list.append(f"Error: Invalid ingredient at index {i}")
-                 continue
-
-            try:
-                print(f"Processing ingredient '{ingredient}' for search...")
-
-                # Embed the query text for the current ingredient and cuisine
-                query_text = f"{ingredient} {cuisine} cuisine taste"
-                try:
-                    query_vector = pinecone_manager.embedder.encode(query_text).tolist()
-                except AttributeError:
-                     query_vector = pinecone_manager.embedder.encode(query_text)
-                     if not isinstance(query_vector, list):
-                         print(f"Warning: Embedder did not return a list or numpy array for '{query_text}'. Skipping search for this ingredient.")
-                         augmented_prompts_list.append(f"Error embedding ingredient '{ingredient}'")
-                         continue
-
-                # --- Call the search method, passing user_id, ingredient, and min_score ---
-                # The search method in PineconeManager should now filter by user_id AND ingredient metadata
-                # and apply the min_score threshold.
-                # It returns a list of matches.
-                search_results_list = pinecone_manager.search( # Renamed variable to clarify it's a list
-                    query_vector=query_vector,
-                    top_k=5, # Retrieve up to 5 matches for this ingredient/user (after filtering/thresholding)
-                    user_id=user_id,       # Pass the user_id for filtering
-                    ingredient=ingredient, # Pass the current ingredient for filtering
-                    min_score=MINIMUM_SIMILARITY_SCORE # Pass the minimum score threshold
-                    # namespace="" # Add namespace if using
-                )
-                # --- End of search call ---
-
-                # --- Debug Print for search_results_list ---
-                print(f"Debug: After pinecone_manager.search for '{ingredient}':")
-                print(f"Debug: Type of search_results_list: {type(search_results_list)}")
-                if isinstance(search_results_list, list):
-                     print(f"Debug: Number of matches found: {len(search_results_list)}")
-                     if search_results_list:
-                          print(f"Debug: First match object preview: {search_results_list[0]}")
-                          # You can print the type of the first element if needed:
-                          # print(f"Debug: Type of first element: {type(search_results_list[0])}")
-                else:
-                     print("Debug: search_results_list is not a list.")
-                # --- End Debug Print ---
-
-
-                # --- Process Filtered and Thresholded Matches and Build Prompt ---
-                # build_prompt_augmentation expects a list of matches, queried ingredient, AND user servings
-                # Pass the list returned by pinecone_manager.search directly
-                filtered_and_thresholded_matches = search_results_list # Use the list directly
-
-
-                # Pass the list of matches (already filtered by Pinecone), queried ingredient, and user_servings_int
-                # build_prompt_augmentation will use only the top match from filtered_and_thresholded_matches
-                prompt_augmentation_string = build_prompt_augmentation(filtered_and_thresholded_matches, ingredient, user_servings_int)
-
-                # Append the result for this ingredient to the list
-                augmented_prompts_list.append(prompt_augmentation_string)
-
-            except Exception as e:
-                print(f"Error processing ingredient '{ingredient}' for user '{user_id}': {e}")
-                errors.append(f"Error processing '{ingredient}': {str(e)}")
-                augmented_prompts_list.append(f"Error processing '{ingredient}'")
-
-        # --- Return Search Response ---
-        response_body = {
-            'user_id': user_id,
-            'cuisine': cuisine,
-            'ingredients_processed': ingredient_list,
-            'user_servings': user_servings_int, # Include user servings in response
-            'augmented_prompts': augmented_prompts_list,
-            'status': 'success' if not errors else ('partial_success' if len(errors) < len(ingredient_list) else 'failure'),
-            'errors': errors
-        }
+def handle_update(request_body, headers):
+    """
+    Handles POST /update: applies "more"/"less"/"perfect" feedback to the
+    user's matching taste preference.
 
+    Expects a JSON body like:
+    { "user_id": "...", "cuisine": "...", "ingredient": "...", "feedback": "..." }
+    """
+    logger.debug("Handling Feedback Update Request...")
+    # Basic input validation for update
+    try:
+        update_request = UpdateRequest.model_validate(request_body)
+    except ValidationError:
         return {
-            'statusCode': 200 if not errors else (207 if len(errors) < len(ingredient_list) else 500),
-            'headers': headers,
-            'body': json.dumps(response_body)
+            'statusCode': 400,
+             'headers': headers,
+            'body': UPDATE_INVALID_PARAMS_BODY
         }
 
-    # --- Handle Feedback Update Operation ---
-    # Assuming the update path is something like /<stage>/update
-    elif '/update' in request_path and event.get('httpMethod') == 'POST':
-        print("Handling Feedback Update Request...")
-        # --- Parse Request Input for Update ---
-        # Expecting a POST request with a JSON body like:
-        # { "user_id": "...", "cuisine": "...", "ingredient": "...", "feedback": "..." }
-        try:
-            if event.get('body'):
-                 request_body = json.loads(event['body'])
-                 user_id = request_body.get('user_id')
-                 cuisine = request_body.get('cuisine')
-                 ingredient = request_body.get('ingredient')
-                 feedback = request_body.get('feedback')
-            else:
-                 return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Missing request body for update. Expecting POST with JSON body.'})
-                 }
-
-            # Basic input validation for update
-            valid_feedbacks = ["more", "less", "perfect"]
-            if not user_id or not cuisine or not ingredient or feedback not in valid_feedbacks:
-                return {
-                    'statusCode': 400,
-                     'headers': headers,
-                    'body': json.dumps({'error': f"Missing or invalid required parameters for update. Expecting user_id (string), cuisine (string), ingredient (string), and feedback (one of {valid_feedbacks})."})
-                }
-
-            print(f"Update Request: User ID: {user_id}, Cuisine: '{cuisine}', Ingredient: '{ingredient}', Feedback: '{feedback}'")
-
-        except json.JSONDecodeError:
-             print("Error decoding JSON body for update.")
-             return {
-                 'statusCode': 400,
-                  'headers': headers,
-                 'body': json.dumps({'error': 'Invalid JSON body for update'})
-             }
-        except Exception as e:
-             print(f"Error parsing update request input: {e}")
-             return {
-                 'statusCode': 400,
-                  'headers': headers,
-                 'body': json.dumps(f"Error processing update input: {str(e)}")
-             }
-
-        # --- Call the Update Function ---
-        try:
-            # Call the update function with user_id, ingredient, cuisine, feedback
-            # Assuming you are using the default namespace ("")
-            # If using a specific namespace, add namespace="your_namespace"
-            updated_pinecone_id = pinecone_manager.update_user_taste_feedback(
-                user_id=user_id,
-                ingredient=ingredient,
-                cuisine=cuisine,
-                feedback=feedback
-                # namespace="your_namespace" # Uncomment if using namespace
-            )
-
-            # --- Return Update Response ---
-            if updated_pinecone_id:
-                print(f"Update successful for Pinecone ID: {updated_pinecone_id}")
-                return {
-                    'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'status': 'success', 'message': 'Taste feedback updated successfully', 'pinecone_id': updated_pinecone_id})
-                }
-            else:
-                print("Update function did not return a valid Pinecone ID, update may have failed.")
-                return {
-                    'statusCode': 500, # Internal Server Error or 404 if item not found
-                    'headers': headers,
-                    'body': json.dumps({'status': 'failure', 'message': 'Failed to update taste feedback. Item not found or an error occurred during update.'})
-                }
-
-        except Exception as e:
-            print(f"An error occurred during the feedback update operation: {e}")
+    user_id = update_request.user_id
+    cuisine = update_request.cuisine
+    ingredient = update_request.ingredient
+    feedback = update_request.feedback
+
+    logger.info("Update Request: User ID: %s, Cuisine: '%s', Ingredient: '%s', Feedback: '%s'",
+                user_id, cuisine, ingredient, feedback)
+
+    # --- Call the Update Function ---
+    try:
+        # Call the update function with user_id, ingredient, cuisine, feedback
+        # Assuming you are using the default namespace ("")
+        # If using a specific namespace, add namespace="your_namespace"
+        updated_pinecone_id = pinecone_manager.update_user_taste_feedback(
+            user_id=user_id,
+            ingredient=ingredient,
+            cuisine=cuisine,
+            feedback=feedback,
+            pinecone_id=update_request.pinecone_id
+            # namespace="your_namespace" # Uncomment if using namespace
+        )
+
+        # --- Return Update Response ---
+        if updated_pinecone_id:
+            logger.info("Update successful for Pinecone ID: %s", updated_pinecone_id)
             return {
-                'statusCode': 500,
+                'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({'status': 'error', 'message': f"An internal server error occurred during update: {str(e)}"})
+                'body': _dumps({'status': 'success', 'message': 'Taste feedback updated successfully', 'pinecone_id': updated_pinecone_id})
+            }
+        else:
+            logger.warning("Update function did not return a valid Pinecone ID, update may have failed.")
+            return {
+                'statusCode': 500, # Internal Server Error or 404 if item not found
+                'headers': headers,
+                'body': _dumps({'status': 'failure', 'message': 'Failed to update taste feedback. Item not found or an error occurred during update.'})
             }
 
-    # --- Handle Unsupported Path/Method ---
-    else:
-        print(f"Unsupported path '{request_path}' or method '{event.get('httpMethod')}'")
+    except Exception as e:
+        logger.error("An error occurred during the feedback update operation: %s", e)
         return {
-            'statusCode': 404, # Not Found
+            'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f"Endpoint not found. Supported paths: /search (POST), /update (POST)"})
+            'body': _dumps({'status': 'error', 'message': f"An internal server error occurred during update: {str(e)}"})
+        }
+
+
+# (httpMethod, operation) -> handler. The operation is the last path segment,
+# so '/search' and '/default/search' (with or without a '/{proxy+}' resource) all match.
+ROUTES = {
+    ('POST', '/search'): handle_search,
+    ('POST', '/update'): handle_update,
+}
+
+
+def _route_key(event):
+    """Returns the (httpMethod, '/<operation>') key used to look up ROUTES."""
+    # event['path'] is the requested path (e.g., '/default/search'); its last
+    # segment names the operation even behind a '/{proxy+}' resource. The
+    # event['resource'] path template is only a fallback for events without a path.
+    path = event.get('path') or event.get('resource') or ''
+    operation = path.rstrip('/').rsplit('/', 1)[-1].lower()
+    return (event.get('httpMethod'), '/' + operation)
+
+
+# Response headers are built once per execution environment and shared by
+# every response (they are only read when the response is serialized).
+JSON_HEADERS = {'Content-Type': 'application/json'}
+CORS_HEADERS = {
+    **JSON_HEADERS,
+    'Access-Control-Allow-Origin': '*', # Be specific about your frontend domain in production
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET' # Allow methods used by both paths
+}
+
+
+def _static_response(status_code, headers, body):
+    """Builds a complete proxy response whose body is serialized once, now."""
+    return {'statusCode': status_code, 'headers': headers, 'body': _dumps(body)}
+
+# Pre-built responses for the error paths whose content never changes. They
+# are returned as-is (and shared), so they must never be mutated.
+INDEX_UNAVAILABLE_RESPONSE = _static_response(500, JSON_HEADERS, {'error': 'Pinecone index not available'})
+EMBEDDER_UNAVAILABLE_RESPONSE = _static_response(500, JSON_HEADERS, {'error': 'Embedding model not available'})
+NOT_FOUND_RESPONSE = _static_response(404, CORS_HEADERS, {'error': "Endpoint not found. Supported paths: /search (POST), /update (POST)"})
+# Body errors, keyed by route operation ('/search', '/update')
+MISSING_BODY_RESPONSES = {
+    operation: _static_response(400, CORS_HEADERS, {'error': f"Missing request body for {operation.lstrip('/')}. Expecting POST with JSON body."})
+    for _, operation in ROUTES
+}
+INVALID_JSON_RESPONSES = {
+    operation: _static_response(400, CORS_HEADERS, {'error': f"Invalid JSON body for {operation.lstrip('/')}"})
+    for _, operation in ROUTES
+}
+NON_OBJECT_BODY_RESPONSES = {
+    operation: _static_response(400, CORS_HEADERS, {'error': f"Invalid JSON body for {operation.lstrip('/')}. Expecting a JSON object."})
+    for _, operation in ROUTES
+}
+
+
+# --- AWS Lambda Handler Function ---
+# This function is the entry point for Lambda invocations (triggered by API Gateway etc.)
+# It checks readiness, parses the JSON body once and dispatches through ROUTES.
+def lambda_handler(event, context):
+    # Check if initialization was successful (a no-op after the first call)
+    _get_manager()
+    if not is_initialized:
+        return {
+            'statusCode': 500,
+            'headers': JSON_HEADERS,
+            'body': _dumps({'error': 'Service failed to initialize', 'details': initialization_error})
         }
+
+    # Ensure Pinecone index and embedder are ready (double-check after init)
+    if not pinecone_manager.index:
+         return INDEX_UNAVAILABLE_RESPONSE
+    if not pinecone_manager.embedder:
+         return EMBEDDER_UNAVAILABLE_RESPONSE
+
+    # Include CORS headers in all responses
+    headers = CORS_HEADERS
+
+    # --- Determine the operation with a single dict lookup ---
+    method, operation = _route_key(event)
+    route_handler = ROUTES.get((method, operation))
+    if route_handler is None:
+        logger.warning("Unsupported path '%s' or method '%s'", event.get('path', ''), method)
+        return NOT_FOUND_RESPONSE # Not Found
+
+    # --- Parse the JSON body once for every route ---
+    if not event.get('body'):
+        return MISSING_BODY_RESPONSES[operation]
+    try:
+        request_body = orjson.loads(event['body'])
+    except orjson.JSONDecodeError:
+        logger.warning("Error decoding JSON body for %s.", operation.lstrip('/'))
+        return INVALID_JSON_RESPONSES[operation]
+    if not isinstance(request_body, dict):
+        return NON_OBJECT_BODY_RESPONSES[operation]
+
+    return route_handler(request_body, headers)
@@ -1,134 +1,143 @@
 # project_root/main.py
-import json # Needed for potential future use or if prompt_builder uses it, though not strictly for input parsing here
-import os # Needed for config
-
-# Import your project modules
-from vector_db.embedder import embedder # Make sure embedder instance is imported
-from vector_db.pinecone_client import PineconeManager # Import the class
-from utils.prompt_builder import build_prompt_augmentation
-from config import PINECONE_DIMENSION, PINECONE_INDEX_NAME # Used in PineconeManager init, not directly here
+# Only the query path is imported here; MongoDB (pymongo/bson) is loaded by
+# the ingest scripts alone, so starting the search CLI never pays for it.
+from vector_db.bootstrap import get_pinecone_manager # Shared PineconeManager (and embedder)
+from utils.prompt_builder import build_prompt_augmentation_batch
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple # Import for type hinting
+import argparse
+import json
 
 # Initialize PineconeManager with the embedder instance AFTER embedder is available
 # This runs once when the script starts
-pinecone_manager = PineconeManager(embedder=embedder)
-
-def main():
-    print("Starting the application...")
-
-    # Ensure Pinecone manager is initialized and connected to the index
-    if not pinecone_manager.pinecone or not pinecone_manager.index:
-        print("\nPinecone initialization failed or index not available. Exiting.")
-        # The pinecone_manager already prints detailed errors during init and index connection
-        return
-
-    # Ensure embedder is available in the manager
-    if not pinecone_manager.embedder:
-        print("Embedding model not available in PineconeManager. Cannot perform search query embedding. Exiting.")
-        return
-
+pinecone_manager = get_pinecone_manager()
+
+# Ranking key for (feedback_weight, match) pairs
+_FEEDBACK_WEIGHT_KEY = itemgetter(0)
+# Printed between consecutive prompts in the final output
+PROMPT_SEPARATOR = "\n" + "-" * 20 + "\n"
+
+def _parse_args(argv=None):
+    """Parses the command line. Without --json the script prompts for one request."""
+    parser = argparse.ArgumentParser(description="Personalized ingredient quantity recommendations.")
+    parser.add_argument(
+        "--json", type=argparse.FileType("r"),
+        help="JSON file ('-' for stdin) holding one request object or a list of them, each with "
+             "user_id, cuisine, ingredients and servings. Replaces the interactive prompts."
+    )
+    return parser.parse_args(argv)
+
+
+def _read_request_from_input() -> Dict[str, Any]:
+    """Prompts for a single request on stdin (the interactive fallback)."""
     print("--- Personalized Ingredient Quantity Recommendation ---")
     print("Enter details to get recommendations based on your taste history.")
 
-    # --- Get User Input ---
-    user_id_input = input("Enter your User ID: ")
-    cuisine_input = input("Enter the Cuisine you are interested in: ")
-    # Ask for ingredients as a comma-separated list
-    ingredients_input_str = input("Enter Ingredients you are using (comma-separated, e.g., 'chicken, rice, beans'): ")
-    # Ask for desired servings
-    servings_input_str = input("Enter Desired Servings (integer): ")
-
-    # Split the comma-separated string into a list
-    ingredient_list_input = [item.strip() for item in ingredients_input_str.split(',') if item.strip()]
+    return {
+        "user_id": input("Enter your User ID: "),
+        "cuisine": input("Enter the Cuisine you are interested in: "),
+        # Ask for ingredients as a comma-separated list
+        "ingredients": input("Enter Ingredients you are using (comma-separated, e.g., 'chicken, rice, beans'): "),
+        # Ask for desired servings
+        "servings": input("Enter Desired Servings (integer): "),
+    }
+
+
+def _validate_request(raw_request: Any, label: str) -> Optional[Tuple[str, str, List[str], int]]:
+    """
+    Validates one request, from the prompts or from the --json file.
+
+    Args:
+        raw_request: Dict with user_id, cuisine, ingredients (list or comma-separated
+                     string) and servings.
+        label: Prefix for error messages (identifies the request in a batch).
+
+    Returns:
+        (user_id, cuisine, ingredient_list, servings), or None if the request is invalid.
+    """
+    if not isinstance(raw_request, dict):
+        print(f"\n{label}Error: Each request must be a JSON object.")
+        return None
+
+    user_id = raw_request.get("user_id") or ""
+    cuisine = raw_request.get("cuisine") or ""
+    ingredients = raw_request.get("ingredients") or []
+    # The prompts give a comma-separated string; JSON requests may use either form
+    if isinstance(ingredients, str):
+        ingredients = ingredients.split(',')
+    # Each item is stripped once; blank and non-string items are dropped here,
+    # so this list is the only place ingredients are validated
+    ingredient_list = [stripped for item in ingredients if isinstance(item, str) and (stripped := item.strip())]
 
     # Attempt to convert servings input to an integer
     try:
-        servings_input = int(servings_input_str)
-        if servings_input <= 0:
-             print("\nError: Servings must be a positive integer.")
-             return
-    except ValueError:
-        print("\nError: Invalid input for Servings. Please enter an integer.")
-        return
+        servings = int(raw_request.get("servings"))
+        if servings <= 0:
+             print(f"\n{label}Error: Servings must be a positive integer.")
+             return None
+    except (TypeError, ValueError):
+        print(f"\n{label}Error: Invalid input for Servings. Please enter an integer.")
+        return None
 
     # Basic validation for required inputs
-    if not user_id_input or not cuisine_input or not ingredient_list_input:
-        print("\nError: User ID, Cuisine, and at least one Ingredient are required.")
-        return
+    if not user_id or not cuisine or not ingredient_list:
+        print(f"\n{label}Error: User ID, Cuisine, and at least one Ingredient are required.")
+        return None
+
+    return str(user_id), str(cuisine), ingredient_list, servings
 
-    print("\n--- Processing Ingredients ---")
 
-    # --- Process Each Ingredient and Perform Search ---
+def _print_recommendations(user_id_input: str, cuisine_input: str, ingredient_list_input: List[str],
+                           servings_input: int, search_results_by_ingredient: Dict[str, Any]):
+    """Builds and prints the augmented prompt for every ingredient of one request."""
     augmented_prompts_list = [] # List to store results for each ingredient
     errors = [] # Collect any errors during processing individual ingredients
 
-    # Define the minimum similarity score for this search (adjust as needed)
-    MINIMUM_SIMILARITY_SCORE = 0.6
-
-    for i, ingredient in enumerate(ingredient_list_input):
-        # Basic validation for each ingredient in the list
-        if not isinstance(ingredient, str) or not ingredient.strip():
-             print(f"Skipping invalid ingredient at index {i}: '{ingredient}'")
-             augmented_prompts_list.append(f"Error: Invalid ingredient at index {i}")
-             continue
-
+    # --- Rank every distinct ingredient's matches ---
+    # ingredient_list_input only holds non-blank strings (see _validate_request),
+    # so the ingredients need no further checks here
+    ranked_matches_by_ingredient = {}
+    failures_by_ingredient = {} # ingredient -> exception, from ranking or prompt building
+    for ingredient in search_results_by_ingredient:
         try:
             print(f"Processing ingredient '{ingredient}' for user '{user_id_input}', cuisine '{cuisine_input}'...")
 
-            # Embed the query text for the current ingredient and cuisine
-            # Keep the query text broad to find related preferences within the user/cuisine
-            query_text = f"{ingredient} "#{cuisine_input} cuisine taste
-            try:
-                # Ensure .tolist() is used ONLY if pinecone_manager.embedder.encode returns a numpy array.
-                query_vector = pinecone_manager.embedder.encode(query_text).tolist()
-            except AttributeError: # Handle case where embedder might return list directly
-                 query_vector = pinecone_manager.embedder.encode(query_text)
-                 if not isinstance(query_vector, list):
-                     print(f"Warning: Embedder did not return a list or numpy array for '{query_text}'. Skipping search.")
-                     augmented_prompts_list.append(f"Error embedding ingredient '{ingredient}'")
-                     continue # Skip search if embedding failed
-
-            # --- Call the search method, passing user_id, ingredient, and min_score ---
-            # The search method in PineconeManager should now filter by user_id AND ingredient metadata
-            # and apply the min_score threshold.
-            # Using the search method from the 'pinecone_client_search_final_fix' immersive
-            search_results = pinecone_manager.search(
-                query_vector=query_vector,
-                top_k=5, # Retrieve up to 5 matches for this ingredient/user (after filtering/thresholding)
-                user_id=user_id_input,       # Pass the user_id for filtering
-                ingredient=ingredient, # Pass the current ingredient for filtering
-                min_score=MINIMUM_SIMILARITY_SCORE # Pass the minimum score threshold
-                # namespace="" # Add namespace if using
-            )
-            # --- End of search call ---
-
-            # --- Process Filtered and Thresholded Matches and Build Prompt ---
-            # build_prompt_augmentation expects a list of matches, queried ingredient, AND user servings
-            # Get the matches list from the search_results object, handling None/missing attribute
-            thresholded_matches = search_results.matches if search_results and hasattr(search_results, 'matches') and search_results.matches is not None else []
-            sorted_matches = sorted(thresholded_matches, key=lambda x: x['metadata']['feedback_weight'], reverse=True)
-            filtered_and_thresholded_matches= [match for match in sorted_matches if match['score'] >= MINIMUM_SIMILARITY_SCORE]
-
-            # Pass the list of matches (already filtered by Pinecone), queried ingredient, and user_servings_int
-            # build_prompt_augmentation will use only the top match from filtered_and_thresholded_matches
-            prompt_augmentation_string = build_prompt_augmentation(filtered_and_thresholded_matches[0], ingredient, servings_input)
-
-            # Append the result for this ingredient to the list
-            augmented_prompts_list.append(prompt_augmentation_string)
-
+            # batch_search returns a plain list of matches, already limited to
+            # scores >= MINIMUM_SIMILARITY_SCORE, so no client-side re-check is needed
+            thresholded_matches = search_results_by_ingredient[ingredient] or []
+            # Rank by feedback weight. Each match is decorated with its weight once,
+            # so the sort key is a C-level itemgetter rather than a lambda doing
+            # two lookups per comparison.
+            weighted_matches = [(match['metadata']['feedback_weight'], match) for match in thresholded_matches]
+            weighted_matches.sort(key=_FEEDBACK_WEIGHT_KEY, reverse=True)
+            ranked_matches_by_ingredient[ingredient] = [match for _, match in weighted_matches]
         except Exception as e:
+            failures_by_ingredient[ingredient] = e
+
+    # --- Build every prompt in one call ---
+    # Each prompt uses only the top ranked match of its ingredient
+    prompts_by_ingredient, prompt_failures = build_prompt_augmentation_batch(ranked_matches_by_ingredient, servings_input)
+    failures_by_ingredient.update(prompt_failures)
+
+    # One result (and error) per listed ingredient, repeats included
+    for ingredient in ingredient_list_input:
+        if ingredient in prompts_by_ingredient:
+            augmented_prompts_list.append(prompts_by_ingredient[ingredient])
+        else:
+            e = failures_by_ingredient[ingredient]
             print(f"Error processing ingredient '{ingredient}' for user '{user_id_input}': {e}")
             errors.append(f"Error processing '{ingredient}': {str(e)}")
             augmented_prompts_list.append(f"Error processing '{ingredient}'")
 
     # --- Print Final Augmented Prompts ---
-    print("\n--- Generated Augmented Prompts ---")
+    print(f"\n--- Generated Augmented Prompts (user '{user_id_input}') ---")
     if augmented_prompts_list:
-        # Print each generated prompt on a new line
-        for i, prompt_str in enumerate(augmented_prompts_list):
-            print(f"Prompt for '{ingredient_list_input[i]}':")
-            print(prompt_str)
-            if i < len(augmented_prompts_list) - 1:
-                print("-" * 20) # Separator between prompts
+        # Build the whole block and write it with one print call instead of
+        # two or three writes per prompt, with a separator between prompts
+        print(PROMPT_SEPARATOR.join(
+            f"Prompt for '{ingredient}':\n{prompt_str}"
+            for ingredient, prompt_str in zip(ingredient_list_input, augmented_prompts_list)
+        ))
     else:
         print("No prompts were generated for any of the ingredients.")
 
@@ -137,6 +146,93 @@ def main():
         for error_msg in errors:
             print(error_msg)
 
+
+def main(argv=None):
+    args = _parse_args(argv)
+    print("Starting the application...")
+
+    # Ensure Pinecone manager is initialized and connected to the index
+    if not pinecone_manager.pinecone or not pinecone_manager.index:
+        print("\nPinecone initialization failed or index not available. Exiting.")
+        # The pinecone_manager already prints detailed errors during init and index connection
+        return
+
+    # Ensure embedder is available in the manager
+    if not pinecone_manager.embedder:
+        print("Embedding model not available in PineconeManager. Cannot perform search query embedding. Exiting.")
+        return
+
+    # --- Get User Input ---
+    # A --json file lets an upstream process submit many users' requests in
+    # one invocation; otherwise prompt for a single request.
+    if args.json:
+        try:
+            with args.json:
+                raw_requests = json.load(args.json)
+        except json.JSONDecodeError as e:
+            print(f"\nError: Could not parse --json input: {e}")
+            return
+        if not isinstance(raw_requests, list):
+            raw_requests = [raw_requests]
+        labels = [f"[request {i}] " for i in range(len(raw_requests))]
+    else:
+        raw_requests = [_read_request_from_input()]
+        labels = [""]
+
+    requests = [request for request in map(_validate_request, raw_requests, labels) if request]
+    if not requests:
+        return
+
+    print("\n--- Processing Ingredients ---")
+
+    # Define the minimum similarity score for this search (adjust as needed)
+    MINIMUM_SIMILARITY_SCORE = 0.6
+
+    # Repeated ingredients are embedded and searched once per request; their
+    # results are reused for every occurrence. (Exact matches only: each
+    # search is filtered on the exact ingredient string.)
+    unique_ingredients_per_request = [list(dict.fromkeys(ingredients)) for _, _, ingredients, _ in requests]
+
+    # --- Embed every request's ingredient queries in one batched encode() call ---
+    # Keep the query text broad to find related preferences within the user/cuisine
+    # (the ingredient lists only hold non-blank strings, see _validate_request)
+    query_texts = [f"{ingredient} " for unique_ingredients in unique_ingredients_per_request
+                   for ingredient in unique_ingredients] #{cuisine_input} cuisine taste
+    try:
+        # One padded forward pass instead of one encode() call per ingredient;
+        # returns one list[float] (the format search() expects) per text.
+        # encode_queries() serves repeated (case/whitespace-insensitive) queries
+        # from the embedder's LRU cache and only embeds the rest.
+        query_vectors = pinecone_manager.embedder.encode_queries(query_texts, batch_size=32)
+    except Exception as e:
+        print(f"\nError embedding ingredients: {e}")
+        return
+
+    # --- Search every ingredient of every request concurrently ---
+    # start_batch_search() puts a request's queries in flight over the gRPC
+    # channel and returns without waiting, so all requests' searches are
+    # started before any of them are collected and the whole batch costs
+    # about one Pinecone round trip. Each query is filtered by user_id AND
+    # ingredient metadata and the min_score threshold is applied.
+    pending_searches = []
+    offset = 0
+    for (user_id_input, _, _, _), unique_ingredients in zip(requests, unique_ingredients_per_request):
+        pending_searches.append(pinecone_manager.start_batch_search(
+            query_vectors=query_vectors[offset:offset + len(unique_ingredients)],
+            ingredients=unique_ingredients, # Each query is filtered on its own ingredient
+            top_k=5, # Retrieve up to 5 matches for this ingredient/user (after filtering/thresholding)
+            user_id=user_id_input,       # Pass the user_id for filtering
+            min_score=MINIMUM_SIMILARITY_SCORE # Pass the minimum score threshold
+            # namespace="" # Add namespace if using
+        ))
+        offset += len(unique_ingredients)
+
+    for (user_id_input, cuisine_input, ingredient_list_input, servings_input), unique_ingredients, collect_results in zip(
+            requests, unique_ingredients_per_request, pending_searches):
+        search_results_by_ingredient = dict(zip(unique_ingredients, collect_results()))
+        _print_recommendations(user_id_input, cuisine_input, ingredient_list_input, servings_input,
+                               search_results_by_ingredient)
+
     print("\nProcess finished.")
 
 
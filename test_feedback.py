@@ -1,6 +1,5 @@
 # project_root/test_feedback.py
-from vector_db.embedder import embedder # Make sure embedder instance is imported
-from vector_db.pinecone_client import PineconeManager # Import the class
+from vector_db.bootstrap import get_pinecone_manager # Shared PineconeManager (and embedder)
 from config import PINECONE_INDEX_NAME # Import for potential namespace or just info
 
 def test_feedback_update():
@@ -12,8 +11,8 @@ def test_feedback_update():
     print("--- Test Feedback Update Script ---")
 
     # --- Initialize Pinecone Manager ---
-    # Initialize PineconeManager with the embedder instance
-    pinecone_manager = PineconeManager(embedder=embedder)
+    # Get the process-wide PineconeManager (created with the embedder on first use)
+    pinecone_manager = get_pinecone_manager()
 
     # Ensure Pinecone manager is initialized and connected
     if not pinecone_manager.pinecone or not pinecone_manager.index:
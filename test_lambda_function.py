@@ -1,7 +1,7 @@
 # project_root/test_lambda_locally.py
-import json
+import orjson # Faster than the stdlib json module for the request/response bodies
 import os
-from unittest.mock import MagicMock # Used to create a dummy context object
+import types # SimpleNamespace serves as the dummy context object
 
 # Import your lambda_handler function from lambda_function.py
 # Make sure lambda_function.py is in your project structure
@@ -9,13 +9,51 @@ from unittest.mock import MagicMock # Used to create a dummy context object
 # Assuming lambda_function.py is at the project root for this example
 try:
     # If lambda_function.py is at the root
-    from lambda_function import lambda_handler
+    from lambda_function import lambda_handler, _route_key
 except ImportError:
     # If lambda_function.py is inside an 'api' directory
     # from api.lambda_function import lambda_handler # Adjust import based on your structure
     print("Error: Could not import lambda_handler. Make sure lambda_function.py is in the correct path.")
     print("Adjust the import statement in test_lambda_locally.py if needed.")
     lambda_handler = None # Set to None if import fails
+    _route_key = None
+
+# Dummy context object (often not used in simple handlers, but required by signature).
+# The handler only reads attributes from it, so a plain namespace built once is enough.
+LAMBDA_CONTEXT = types.SimpleNamespace(
+    aws_request_id='test-request-id',
+    function_name='test-lambda-function',
+    invoked_function_arn='arn:aws:lambda:us-east-1:123456789012:function:test-lambda-function',
+    memory_limit_in_mb='128', # Example memory limit
+    get_remaining_time_in_millis=lambda: 60000 # Example remaining time
+)
+
+# Simulated API Gateway event structure, built once. Each call copies it
+# and only sets the body (the handler never mutates the nested dicts).
+_EVENT_TEMPLATE = {
+    'httpMethod': 'POST',
+    'headers': {
+        'Content-Type': 'application/json',
+        # Add other headers if needed for your Lambda logic
+    },
+    'queryStringParameters': None, # No query parameters for a POST body example
+    'pathParameters': None,
+    'requestContext': { # Minimal request context
+        'accountId': '123456789012',
+        'resourceId': 'xyz123',
+        'stage': 'test', # Simulate the stage name
+        'requestId': 'test-request-id',
+        'identity': {'sourceIp': '127.0.0.1'},
+        'httpMethod': 'POST',
+        'path': '/search', # Or whatever path you configure
+    },
+    # --- FIX MADE HERE: Explicitly set the 'path' key in the event ---
+    # This is what your lambda_handler is checking
+    'path': '/test/search', # Set the path to simulate hitting the search endpoint
+    # --- END FIX ---
+    'isBase64Encoded': False,
+    'stageVariables': None
+}
 
 def simulate_api_gateway_event(user_id: str, cuisine: str, ingredients: list[str], servings: int) -> dict:
     """
@@ -39,36 +77,24 @@ def simulate_api_gateway_event(user_id: str, cuisine: str, ingredients: list[str
         "ingredients": ingredients,
         "servings": servings # Include servings in the request body
     }
-    request_body_json_string = json.dumps(request_body_dict)
+    # orjson emits compact JSON, matching what API Gateway actually sends
+    request_body_json_string = orjson.dumps(request_body_dict).decode()
 
-    # Simulate the API Gateway event structure
-    event = {
-        'httpMethod': 'POST',
-        'body': request_body_json_string,
-        'headers': {
-            'Content-Type': 'application/json',
-            # Add other headers if needed for your Lambda logic
-        },
-        'queryStringParameters': None, # No query parameters for a POST body example
-        'pathParameters': None,
-        'requestContext': { # Minimal request context
-            'accountId': '123456789012',
-            'resourceId': 'xyz123',
-            'stage': 'test', # Simulate the stage name
-            'requestId': 'test-request-id',
-            'identity': {'sourceIp': '127.0.0.1'},
-            'httpMethod': 'POST',
-            'path': '/search', # Or whatever path you configure
-        },
-        # --- FIX MADE HERE: Explicitly set the 'path' key in the event ---
-        # This is what your lambda_handler is checking
-        'path': '/test/search', # Set the path to simulate hitting the search endpoint
-        # --- END FIX ---
-        'isBase64Encoded': False,
-        'stageVariables': None
-    }
+    event = _EVENT_TEMPLATE.copy()
+    event['body'] = request_body_json_string
     return event
 
+def check_proxy_resource_routing():
+    """
+    Checks that a request arriving through a greedy '/{proxy+}' resource is
+    routed by its path (here '/test/search'), not by the resource template.
+    """
+    event = simulate_api_gateway_event("route-check", "any", ["salt"], 1)
+    event['resource'] = '/{proxy+}'
+    route = _route_key(event)
+    assert route == ('POST', '/search'), f"Proxy resource event routed to {route}, expected ('POST', '/search')"
+    print("Proxy resource routing check passed.")
+
 def main():
     """
     Prompts user for input, simulates Lambda event, calls handler, and prints response.
@@ -77,6 +103,8 @@ def main():
         print("\nCannot run test because lambda_handler could not be imported.")
         return
 
+    check_proxy_resource_routing()
+
     print("--- Local AWS Lambda Function Test ---")
     print("Enter details to simulate an API request.")
 
@@ -110,19 +138,11 @@ def main():
     # Simulate the event structure, including servings
     event = simulate_api_gateway_event(user_id_input, cuisine_input, ingredient_list_input, servings_input)
 
-    # Create a dummy context object (often not used in simple handlers, but required by signature)
-    context = MagicMock()
-    context.aws_request_id = 'test-request-id'
-    context.function_name = 'test-lambda-function'
-    context.invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:test-lambda-function'
-    context.memory_limit_in_mb = '128' # Example memory limit
-    context.get_remaining_time_in_millis = lambda: 60000 # Example remaining time
-
     print("Calling lambda_handler function with simulated event...")
 
     # --- Call the Lambda Handler ---
     # This is where your lambda_function.py code will execute
-    response = lambda_handler(event, context)
+    response = lambda_handler(event, LAMBDA_CONTEXT)
 
     print("\n--- Lambda Handler Response ---")
     # The response is a dictionary that API Gateway would return
@@ -131,9 +151,9 @@ def main():
     print("Body:")
     # The body is a JSON string, so parse and pretty print it
     try:
-        body_dict = json.loads(response.get('body', '{}'))
-        print(json.dumps(body_dict, indent=2))
-    except json.JSONDecodeError:
+        body_dict = orjson.loads(response.get('body', '{}'))
+        print(orjson.dumps(body_dict, option=orjson.OPT_INDENT_2).decode())
+    except orjson.JSONDecodeError:
         print(response.get('body', '')) # Print raw body if not valid JSON
 
     print("\n--- Test Finished ---")
@@ -1,7 +1,7 @@
 # project_root/test_lambda_update.py
-import json
+import orjson # Faster than the stdlib json module for the request/response bodies
 import os
-from unittest.mock import MagicMock # Used to create a dummy context object
+import types # SimpleNamespace serves as the dummy context object
 
 # Import your lambda_handler function from lambda_function.py
 # Make sure lambda_function.py is in your project structure
@@ -17,6 +17,41 @@ except ImportError:
     print("Adjust the import statement in test_lambda_update.py if needed.")
     lambda_handler = None # Set to None if import fails
 
+# Dummy context object (often not used in simple handlers, but required by signature).
+# The handler only reads attributes from it, so a plain namespace built once is enough.
+LAMBDA_CONTEXT = types.SimpleNamespace(
+    aws_request_id='test-update-request-id',
+    function_name='test-lambda-function',
+    invoked_function_arn='arn:aws:lambda:us-east-1:123456789012:function:test-lambda-function',
+    memory_limit_in_mb='128', # Example memory limit
+    get_remaining_time_in_millis=lambda: 60000 # Example remaining time
+)
+
+# Simulated API Gateway event structure, built once. Each call copies it
+# and only sets the body (the handler never mutates the nested dicts).
+# Set the path to simulate a request to the /update endpoint
+_EVENT_TEMPLATE = {
+    'httpMethod': 'POST',
+    'headers': {
+        'Content-Type': 'application/json',
+        # Add other headers if needed for your Lambda logic
+    },
+    'queryStringParameters': None,
+    'pathParameters': None,
+    'requestContext': { # Minimal request context
+        'accountId': '123456789012',
+        'resourceId': 'xyz456', # Different resource ID for update path
+        'stage': 'test',
+        'requestId': 'test-update-request-id',
+        'identity': {'sourceIp': '127.0.0.1'},
+        'httpMethod': 'POST',
+        'path': '/test/update', # Simulate path including a stage (like '/default/update')
+    },
+    'path': '/test/update', # Also include path here as Lambda often uses this
+    'isBase64Encoded': False,
+    'stageVariables': None
+}
+
 def simulate_update_api_gateway_event(user_id: str, cuisine: str, ingredient: str, feedback: str) -> dict:
     """
     Simulates the structure of an AWS API Gateway Proxy Integration event
@@ -38,32 +73,11 @@ def simulate_update_api_gateway_event(user_id: str, cuisine: str, ingredient: st
         "ingredient": ingredient,
         "feedback": feedback
     }
-    request_body_json_string = json.dumps(request_body_dict)
+    # orjson emits compact JSON, matching what API Gateway actually sends
+    request_body_json_string = orjson.dumps(request_body_dict).decode()
 
-    # Simulate the API Gateway event structure
-    # Set the path to simulate a request to the /update endpoint
-    event = {
-        'httpMethod': 'POST',
-        'body': request_body_json_string,
-        'headers': {
-            'Content-Type': 'application/json',
-            # Add other headers if needed for your Lambda logic
-        },
-        'queryStringParameters': None,
-        'pathParameters': None,
-        'requestContext': { # Minimal request context
-            'accountId': '123456789012',
-            'resourceId': 'xyz456', # Different resource ID for update path
-            'stage': 'test',
-            'requestId': 'test-update-request-id',
-            'identity': {'sourceIp': '127.0.0.1'},
-            'httpMethod': 'POST',
-            'path': '/test/update', # Simulate path including a stage (like '/default/update')
-        },
-        'path': '/test/update', # Also include path here as Lambda often uses this
-        'isBase64Encoded': False,
-        'stageVariables': None
-    }
+    event = _EVENT_TEMPLATE.copy()
+    event['body'] = request_body_json_string
     return event
 
 def main():
@@ -93,19 +107,11 @@ def main():
     # Simulate the update event structure
     event = simulate_update_api_gateway_event(user_id_input, cuisine_input, ingredient_input, feedback_input)
 
-    # Create a dummy context object
-    context = MagicMock()
-    context.aws_request_id = 'test-update-request-id'
-    context.function_name = 'test-lambda-function'
-    context.invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:test-lambda-function'
-    context.memory_limit_in_mb = '128' # Example memory limit
-    context.get_remaining_time_in_millis = lambda: 60000 # Example remaining time
-
     print("Calling lambda_handler function with simulated update event...")
 
     # --- Call the Lambda Handler ---
     # This is where your lambda_function.py code will execute the update logic
-    response = lambda_handler(event, context)
+    response = lambda_handler(event, LAMBDA_CONTEXT)
 
     print("\n--- Lambda Handler Response ---")
     # The response is a dictionary that API Gateway would return
@@ -114,9 +120,9 @@ def main():
     print("Body:")
     # The body is a JSON string, so parse and pretty print it
     try:
-        body_dict = json.loads(response.get('body', '{}'))
-        print(json.dumps(body_dict, indent=2))
-    except json.JSONDecodeError:
+        body_dict = orjson.loads(response.get('body', '{}'))
+        print(orjson.dumps(body_dict, option=orjson.OPT_INDENT_2).decode())
+    except orjson.JSONDecodeError:
         print(response.get('body', '')) # Print raw body if not valid JSON
 
     print("\n--- Test Finished ---")
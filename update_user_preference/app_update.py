@@ -1,13 +1,17 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from vector_db.pinecone_client import PineconeManager
-from vector_db.embedder import embedder
+from typing import Optional
+from vector_db.bootstrap import get_pinecone_manager
 from mangum import Mangum
 # Initialize FastAPI app
-app = FastAPI()
+# Responses are serialized with orjson rather than the stdlib json module
+app = FastAPI(default_response_class=ORJSONResponse)
 handler = Mangum(app)
-# Initialize PineconeManager
-pinecone_manager = PineconeManager(embedder=embedder)
+# Initialize PineconeManager at import, so the model load and Pinecone
+# connection happen during the cold start and warm invocations reuse them
+pinecone_manager = get_pinecone_manager()
 
 # Request body schema
 class FeedbackRequest(BaseModel):
@@ -16,6 +20,7 @@ class FeedbackRequest(BaseModel):
     cuisine: str
     feedback: str
     namespace: str = ""  # Optional; default is empty string
+    pinecone_id: Optional[str] = None  # Optional; fetched directly instead of searched for
 
 
 @app.post("/update-preference")
@@ -26,12 +31,16 @@ async def update_preference(data: FeedbackRequest):
     if not pinecone_manager or not pinecone_manager.index:
         raise HTTPException(status_code=500, detail="Pinecone manager or index not initialized.")
 
-    updated_id = pinecone_manager.update_user_taste_feedback(
+    # The update embeds the query and makes blocking Pinecone calls; run it in a
+    # worker thread so the event loop keeps serving other requests meanwhile
+    updated_id = await asyncio.to_thread(
+        pinecone_manager.update_user_taste_feedback,
         user_id=data.user_id,
         ingredient=data.ingredient,
         cuisine=data.cuisine,
         feedback=data.feedback,
-        namespace=data.namespace
+        namespace=data.namespace,
+        pinecone_id=data.pinecone_id
     )
 
     if updated_id:
@@ -0,0 +1,26 @@
+# project_root/utils/batching.py
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar # Import for type hinting
+
+T = TypeVar("T")
+
+
+def chunked(iterable: Iterable[T], n: int) -> Iterator[List[T]]:
+    """
+    Yields successive lists of up to `n` items from `iterable`.
+
+    Only one chunk is held in memory at a time, so this is safe to use on
+    large or unbounded iterators such as MongoDB cursors.
+
+    Args:
+        iterable: Any iterable (list, generator, cursor, ...).
+        n: The maximum number of items per chunk (must be positive).
+
+    Returns:
+        An iterator over lists of at most `n` items. The last chunk may be shorter.
+    """
+    if n <= 0:
+        raise ValueError(f"Chunk size must be positive, got {n}.")
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, n)):
+        yield chunk
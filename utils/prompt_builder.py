@@ -1,5 +1,21 @@
 # project_root/utils/prompt_builder.py
-from typing import List, Dict, Any # Import for type hinting
+import logging
+from typing import List, Dict, Any, Tuple # Import for type hinting
+
+# Called once per ingredient per request, so the debug output below is only
+# formatted when DEBUG logging is enabled.
+logger = logging.getLogger(__name__)
+# Output templates, formatted with % once per call. The header and the
+# trailing details are shared by every template that reports a match.
+_PREFERENCE_HEADER = "Specific taste preference for '%s':\nFor '%s',"
+_PREFERENCE_DETAILS = "in %s cuisine (score: %.2f, weight: %s)."
+_SCALED_PREFERENCE_TEMPLATE = (_PREFERENCE_HEADER + " a recommended amount for %s servings is %s%s"
+                               " (based on a past preference of %s%s for %s servings) " + _PREFERENCE_DETAILS)
+_PAST_PREFERENCE_TEMPLATE = (_PREFERENCE_HEADER + " a past preference shows using %s%s for %s servings "
+                             + _PREFERENCE_DETAILS)
+_FOUND_PREFERENCE_TEMPLATE = _PREFERENCE_HEADER + " a past preference was found " + _PREFERENCE_DETAILS
+_NO_PREFERENCE_TEMPLATE = "No specific taste preferences found in history for '%s'."
+
 # Assuming Pinecone search matches have 'id', 'score', 'values', and 'metadata'
 # We primarily use 'metadata' here.
 
@@ -24,18 +40,56 @@ def build_prompt_augmentation(filtered_matches: List[Any], queried_ingredient: s
         A string summarizing the personalized taste preference with scaled amount,
         or a default message if no relevant matches are found.
     """
-    # --- Debug Print for Input ---
-    print(f"Debug: build_prompt_augmentation received filtered_matches: {filtered_matches}")
-    print(f"Debug: build_prompt_augmentation received queried_ingredient: {queried_ingredient}")
-    print(f"Debug: build_prompt_augmentation received user_servings: {user_servings}")
-    # --- End Debug Print ---
+    return _build_prompt(filtered_matches, queried_ingredient, user_servings, {})
+
+
+def build_prompt_augmentation_batch(filtered_matches_by_ingredient: Dict[str, List[Any]],
+                                    user_servings: int) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+    """
+    Builds the prompt augmentation (see build_prompt_augmentation) for every
+    ingredient of one request in a single call.
+
+    All ingredients share the user's servings, so the serving scaling factor
+    is computed once per distinct stored servings value rather than per ingredient.
+    An ingredient whose matches can't be turned into a prompt (e.g. malformed
+    metadata) is reported on its own; the other prompts are still built.
+
+    Args:
+        filtered_matches_by_ingredient: Queried ingredient -> its filtered matches
+                                        (best first), as for build_prompt_augmentation.
+        user_servings: The desired number of servings provided by the user (integer).
+
+    Returns:
+        (prompts, failures): queried ingredient -> prompt augmentation string, in
+        the input order, and queried ingredient -> the exception that failed it.
+    """
+    scaling_factors = {} # database servings -> user_servings / database servings
+    prompts = {}
+    failures = {}
+    for queried_ingredient, filtered_matches in filtered_matches_by_ingredient.items():
+        try:
+            prompts[queried_ingredient] = _build_prompt(filtered_matches, queried_ingredient, user_servings, scaling_factors)
+        except Exception as e:
+            failures[queried_ingredient] = e
+    return prompts, failures
+
+
+def _build_prompt(filtered_matches: List[Any], queried_ingredient: str, user_servings: int,
+                  scaling_factors: Dict[Any, float]) -> str:
+    """Builds one prompt augmentation; `scaling_factors` caches factors across a batch."""
+    # --- Debug logging for Input ---
+    # Only the count is logged: formatting the matches themselves would render
+    # every vector value of every match on each call.
+    logger.debug("build_prompt_augmentation received %d filtered matches, queried_ingredient: %s, user_servings: %s",
+                 len(filtered_matches), queried_ingredient, user_servings)
+    # --- End Debug logging ---
 
     # Check if the list of filtered matches is empty
     # This check should now be accurate based on the input list
     if not filtered_matches:
         # Return a message indicating no specific preferences were found for the user
         # related to the queried ingredient itself.
-        return f"No specific taste preferences found in history for '{queried_ingredient}'."
+        return _NO_PREFERENCE_TEMPLATE % (queried_ingredient,)
 
     # --- Take only the single top match (the first item in the list) ---
     # This assumes filtered_matches is not empty due to the check above
@@ -56,39 +110,28 @@ def build_prompt_augmentation(filtered_matches: List[Any], queried_ingredient: s
     # Ensure database_amount and database_servings are valid numbers and servings > 0
     if database_amount is not None and database_servings is not None and isinstance(database_amount, (int, float)) and isinstance(database_servings, (int, float)) and database_servings > 0:
         try:
-            # Calculate the scaling factor
-            scaling_factor = user_servings / database_servings
+            # Calculate the scaling factor (once per stored servings value in a batch)
+            scaling_factor = scaling_factors.get(database_servings)
+            if scaling_factor is None:
+                scaling_factor = scaling_factors[database_servings] = user_servings / database_servings
             # Calculate the adjusted amount
             adjusted_amount = database_amount * scaling_factor
             # Optional: Round the adjusted amount for cleaner display
             adjusted_amount = round(adjusted_amount, 2) # Round to 2 decimal places
         except Exception as e:
-            print(f"Warning: Could not calculate adjusted amount for ingredient '{ingredient}' (ID: {top_match.id}). Error: {e}")
+            logger.warning("Could not calculate adjusted amount for ingredient '%s' (ID: %s). Error: %s", ingredient, top_match.id, e)
             # If calculation fails, adjusted_amount remains None
 
     # --- Phrasing focused on the single top preference with SCALED amount ---
-    phrase_parts = [f"For '{ingredient}',"]
-
+    # Each outcome has its own complete template, so the result is one % format.
     if adjusted_amount is not None:
-        # Use the adjusted amount if calculation was successful
-        phrase_parts.append(f"a recommended amount for {user_servings} servings is {adjusted_amount}{unit}")
-        # Add context about the original preference
-        if database_amount is not None and database_servings is not None:
-             phrase_parts.append(f"(based on a past preference of {database_amount}{unit} for {database_servings} servings)")
-    elif database_amount is not None:
+        # Use the adjusted amount if calculation was successful, with context
+        # about the original preference
+        return _SCALED_PREFERENCE_TEMPLATE % (queried_ingredient, ingredient, user_servings, adjusted_amount, unit,
+                                              database_amount, unit, database_servings, cuisine, score, feedback_weight)
+    if database_amount is not None:
         # If adjusted amount calculation failed, but original amount exists, mention original
-        phrase_parts.append(f"a past preference shows using {database_amount}{unit} for {database_servings} servings")
-    else:
-        # If no amount data is available
-        phrase_parts.append("a past preference was found")
-
-
-    # Add remaining details
-    phrase_parts.append(f"in {cuisine} cuisine (score: {score:.2f}, weight: {feedback_weight}).")
-
-    # Join the parts into the final phrase
-    phrase = " ".join(phrase_parts)
-
-    # --- Return the single constructed phrase ---
-    return f"Specific taste preference for '{queried_ingredient}':\n" + phrase
-
+        return _PAST_PREFERENCE_TEMPLATE % (queried_ingredient, ingredient, database_amount, unit, database_servings,
+                                            cuisine, score, feedback_weight)
+    # If no amount data is available
+    return _FOUND_PREFERENCE_TEMPLATE % (queried_ingredient, ingredient, cuisine, score, feedback_weight)
@@ -0,0 +1,16 @@
+# project_root/vector_db/bootstrap.py
+from functools import lru_cache
+from vector_db.embedder import embedder # Import the embedder instance
+from vector_db.pinecone_client import PineconeManager # Import the class
+
+
+@lru_cache(maxsize=1)
+def get_pinecone_manager() -> PineconeManager:
+    """
+    Returns the process-wide PineconeManager, creating it on first call.
+
+    Every entry point (Lambda handlers, FastAPI apps, scripts) shares this one
+    instance, so a process that imports several of them still opens a single
+    Pinecone client and gRPC channel around the single embedder.
+    """
+    return PineconeManager(embedder=embedder)
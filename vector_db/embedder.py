@@ -1,27 +1,334 @@
 # project_root/vector_db/embedder.py
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+# The Rust tokenizer would otherwise start its own thread pool next to
+# PyTorch's (and warn after a fork). Single-text/small-batch tokenization is
+# cheap, so its threads only compete with inference for the same cores.
+# Must be set before `tokenizers` is imported.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import torch
 from sentence_transformers import SentenceTransformer
-from config import EMBEDDING_MODEL_NAME, PINECONE_DIMENSION
+from config import (EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_PATH, EMBEDDING_BACKEND,
+                    EMBEDDING_ONNX_FILE_NAME, EMBEDDING_ONNX_CACHE_PATH, EMBEDDING_ONNX_QUANTIZATION,
+                    EMBEDDING_PRECISION, PINECONE_DIMENSION, TORCH_NUM_THREADS)
+
+# Configure PyTorch once, before the model is loaded. This module only runs
+# inference, so autograd bookkeeping is disabled process-wide, and the thread
+# count is pinned so matmuls use the available cores without oversubscribing.
+torch.set_grad_enabled(False)
+torch.set_num_threads(TORCH_NUM_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Inter-op threads can only be set before any parallel work has started.
+    pass
+
+# Placeholder for Embedder.model before the first load attempt.
+_MODEL_NOT_LOADED = object()
+
+# Maximum number of query texts whose embeddings are kept in memory.
+QUERY_CACHE_SIZE = 4096
+
+def _query_cache_key(text):
+    """
+    Normalizes a query text for the query cache: case-folded, with surrounding
+    and repeated whitespace collapsed, so "Salt  Indian" and "salt indian"
+    share one entry.
+    """
+    return " ".join(text.lower().split())
+
+def _has_safetensors(path):
+    """True if any *.safetensors weights file exists under `path`."""
+    for _, _, files in os.walk(path):
+        if any(name.endswith(".safetensors") for name in files):
+            return True
+    return False
+
+def export_onnx_model(model_source, path, optimization_level="O3", quantization="avx512_vnni"):
+    """
+    Exports a model for the ONNX Runtime backend into a local directory that
+    can be loaded through EMBEDDING_MODEL_PATH (e.g. baked into the image).
+
+    Writes the fp32 "onnx/model.onnx" graph, then optionally a graph-optimized
+    copy and an INT8 dynamically quantized copy of it (the quantized copy is
+    built from the optimized graph when both are requested).
+
+    Args:
+        model_source: Hub model name or local model directory to export.
+        path: The directory to write the model to.
+        optimization_level: Optimum optimization level ("O1"-"O4"), or None to skip.
+                            "O4" adds fp16 and is only meant for GPUs.
+        quantization: Optimum quantization config name ("arm64", "avx2", "avx512",
+                      "avx512_vnni"), or None to skip. Use "arm64" on Graviton.
+
+    Returns:
+        The weights file to set as EMBEDDING_ONNX_FILE_NAME, relative to `path`.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model, export_optimized_onnx_model
+
+    # Loading with the ONNX backend exports the graph when the source has none
+    model = SentenceTransformer(model_source, device="cpu", backend="onnx")
+    model.save(path, safe_serialization=True)
+    file_name = "onnx/model.onnx"
+
+    if optimization_level:
+        export_optimized_onnx_model(model, optimization_level, path)
+        file_name = f"onnx/model_{optimization_level}.onnx"
+        model = SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs={"file_name": file_name})
+
+    if quantization:
+        file_suffix = f"{optimization_level}_qint8_{quantization}" if optimization_level else f"qint8_{quantization}"
+        export_dynamic_quantized_onnx_model(model, quantization, path, file_suffix=file_suffix)
+        file_name = f"onnx/model_{file_suffix}.onnx"
+
+    print(f"Exported ONNX embedding model to '{path}'. Set EMBEDDING_ONNX_FILE_NAME='{file_name}' to use it.")
+    return file_name
 
 class Embedder:
     def __init__(self):
-        """Initializes the sentence transformer model."""
-        try:
-            self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-            print(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded.")
-            # Optional: Verify the dimension matches the configured dimension
-            dummy_embedding = self.model.encode("test").tolist()
-            if len(dummy_embedding) != PINECONE_DIMENSION:
-                 print(f"WARNING: Configured PINECONE_DIMENSION ({PINECONE_DIMENSION}) does not match model output dimension ({len(dummy_embedding)}). Please update config.py.")
+        """Initializes the embedder. The model itself is loaded on first use (see `model`)."""
+        # LRU cache of query text -> embedding (stored as a tuple), shared by
+        # all requests handled by this process.
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # Query cache lookups served from / missing the cache (see query_cache_info)
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self._model = _MODEL_NOT_LOADED
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """
+        The SentenceTransformer, loaded on first access; None if loading failed.
+
+        Importing this module therefore costs nothing until something embeds
+        (PineconeManager touches it at construction, so servers still load
+        it during their cold start).
+        """
+        if self._model is _MODEL_NOT_LOADED:
+            with self._model_lock:
+                if self._model is _MODEL_NOT_LOADED:
+                    try:
+                        model = self._load_model()
+                        print(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded.")
+                        # Optional: Verify the dimension matches the configured dimension.
+                        # The model reports it from its config, without a forward pass.
+                        model_dimension = model.get_sentence_embedding_dimension()
+                        if model_dimension is not None and model_dimension != PINECONE_DIMENSION:
+                             print(f"WARNING: Configured PINECONE_DIMENSION ({PINECONE_DIMENSION}) does not match model output dimension ({model_dimension}). Please update config.py.")
+                    except Exception as e:
+                        print(f"Error loading embedding model '{EMBEDDING_MODEL_NAME}': {e}")
+                        model = None
+                    self._model = model
+        return self._model
+
+    def _load_model(self):
+        """
+        Loads the SentenceTransformer with the configured inference backend.
+        Prefers the local EMBEDDING_MODEL_PATH copy when it exists.
+        Falls back to the PyTorch backend if the ONNX Runtime backend cannot be loaded.
+        """
+        model_source = EMBEDDING_MODEL_NAME
+        if EMBEDDING_MODEL_PATH and os.path.isdir(EMBEDDING_MODEL_PATH):
+            model_source = EMBEDDING_MODEL_PATH
+            print(f"Loading embedding model from local path '{EMBEDDING_MODEL_PATH}'.")
+            if EMBEDDING_BACKEND != "onnx" and not _has_safetensors(EMBEDDING_MODEL_PATH):
+                # pytorch_model.bin is unpickled into memory in full; safetensors
+                # files are memory-mapped and only paged in as layers are touched.
+                print(f"Warning: No .safetensors weights in '{EMBEDDING_MODEL_PATH}'; cold starts will read the full "
+                      "checkpoint. Re-save the model with Embedder.save() to write memory-mappable weights.")
+
+        if EMBEDDING_BACKEND == "onnx":
+            onnx_source, onnx_file_name = model_source, EMBEDDING_ONNX_FILE_NAME
+            if EMBEDDING_PRECISION == "int8" and not onnx_file_name:
+                onnx_source, onnx_file_name = self._cached_int8_onnx_export(model_source)
+            try:
+                model = SentenceTransformer(
+                    onnx_source,
+                    device="cpu",
+                    backend="onnx",
+                    model_kwargs=self._onnx_model_kwargs(onnx_file_name)
+                )
+                print(f"Using ONNX Runtime backend for embeddings ({onnx_file_name or 'default weights'}).")
+                return model
+            except Exception as e:
+                print(f"Warning: Could not load ONNX Runtime backend ({e}). Falling back to PyTorch.")
+        elif EMBEDDING_BACKEND != "torch":
+            print(f"Warning: Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'. Using PyTorch.")
+
+        model_kwargs = {}
+        if EMBEDDING_PRECISION == "float16":
+            model_kwargs["torch_dtype"] = torch.float16
+        elif EMBEDDING_PRECISION not in ("float32", "int8"):
+            print(f"Warning: Unknown EMBEDDING_PRECISION '{EMBEDDING_PRECISION}'. Using float32.")
 
+        model = SentenceTransformer(model_source, device="cpu", model_kwargs=model_kwargs)
+        if EMBEDDING_PRECISION == "int8":
+            # Dynamic quantization: Linear weights are stored as int8 and
+            # activations are quantized on the fly, so the matmuls run on the
+            # CPU's int8 (VNNI) kernels. Done in place to avoid a second copy.
+            try:
+                torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+                print("Quantized embedding model Linear layers to int8.")
+            except Exception as e:
+                print(f"Warning: Could not quantize embedding model to int8 ({e}). Using float32.")
+        return model
+
+    @staticmethod
+    def _cached_int8_onnx_export(model_source):
+        """
+        Returns (model directory, weights file) of an INT8 ONNX export of
+        `model_source`, exporting it into EMBEDDING_ONNX_CACHE_PATH on first
+        use so later cold starts (and processes) load it from disk.
+        Falls back to (model_source, None), i.e. the fp32 graph, if the export fails.
+        """
+        # One cache directory per model, so changing the model never loads a stale export
+        cache_dir = os.path.join(EMBEDDING_ONNX_CACHE_PATH, EMBEDDING_MODEL_NAME.replace("/", "__"))
+        file_name = f"onnx/model_O3_qint8_{EMBEDDING_ONNX_QUANTIZATION}.onnx"
+        if os.path.isfile(os.path.join(cache_dir, file_name)):
+            return cache_dir, file_name
+
+        print(f"No cached INT8 ONNX export in '{cache_dir}'. Exporting '{model_source}' (one-time)...")
+        try:
+            return cache_dir, export_onnx_model(model_source, cache_dir, quantization=EMBEDDING_ONNX_QUANTIZATION)
         except Exception as e:
-            print(f"Error loading embedding model '{EMBEDDING_MODEL_NAME}': {e}")
-            self.model = None
+            print(f"Warning: Could not export INT8 ONNX model ({e}). Using the default ONNX weights.")
+            return model_source, None
+
+    @staticmethod
+    def _onnx_model_kwargs(file_name=EMBEDDING_ONNX_FILE_NAME):
+        """
+        Returns the ONNX Runtime session settings for the ONNX backend:
+        CPU provider, all graph optimizations, TORCH_NUM_THREADS intra-op
+        threads, and the weights file to load (e.g. an INT8 export) if given.
+        """
+        import onnxruntime as ort # Only required for the ONNX backend
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.intra_op_num_threads = TORCH_NUM_THREADS
+
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+        if file_name:
+            model_kwargs["file_name"] = file_name
+        return model_kwargs
+
+    def save(self, path, half_precision=False):
+        """
+        Saves the loaded PyTorch model to a local directory so it can be shipped
+        with the deployment and loaded through EMBEDDING_MODEL_PATH.
+
+        Args:
+            path: The directory to write the model to.
+            half_precision: Save a float16 copy of the weights. The loaded model
+                            itself keeps its precision.
+        """
+        if EMBEDDING_BACKEND == "onnx":
+            raise RuntimeError("Embedder.save() only supports the PyTorch backend. "
+                               "Use export_onnx_model() to write ONNX weights.")
+        if not self.model:
+            raise RuntimeError("Embedding model not loaded. Cannot save it.")
+        model = self.model
+        if half_precision and EMBEDDING_PRECISION != "int8":
+            # .half() converts in place, so convert a copy; the shared model
+            # keeps encoding at its configured precision
+            model = copy.deepcopy(model).half()
+        # safetensors, so EMBEDDING_MODEL_PATH loads memory-map the weights
+        model.save(path, safe_serialization=True)
+        print(f"Embedding model saved to '{path}'.")
+
+    @torch.inference_mode()
+    def encode(self, text, as_numpy=False, **kwargs):
+        """
+        Encodes a text string (or a list of strings) into vector embedding(s).
 
-    def encode(self, text):
-        """Encodes a given text string into a vector embedding."""
+        Passing a list runs a single batched forward pass and returns one
+        embedding per input, in input order. Extra keyword arguments
+        (e.g. batch_size) are forwarded to SentenceTransformer.encode.
+
+        By default the result is converted to Python lists. With as_numpy=True
+        the float32 ndarray is returned as-is; bulk upsert paths use this so
+        vectors stay in one contiguous buffer until the Pinecone client
+        serializes them, instead of being boxed into N x D Python floats.
+
+        Embeddings are L2-normalized (unless normalize_embeddings=False is
+        passed), so stored and query vectors are unit length and the index's
+        cosine score equals their dot product.
+        """
         if not self.model:
             raise RuntimeError("Embedding model not loaded. Cannot encode text.")
-        return self.model.encode(text).tolist() # Return as list for Pinecone
+        # Normalized once here, vectorized over the whole batch, for every caller
+        kwargs.setdefault("normalize_embeddings", True)
+        embeddings = self.model.encode(text, **kwargs)
+        if as_numpy:
+            return embeddings
+        return embeddings.tolist() # Return as list for Pinecone
+
+    def encode_queries(self, texts, batch_size=32):
+        """
+        Encodes a list of query texts, reusing cached embeddings where possible.
+
+        Texts already in the LRU cache are returned without running the model;
+        the remaining (distinct) texts are embedded together in one batched call
+        and added to the cache. Cache entries are keyed by the normalized text
+        (see _query_cache_key), so case/whitespace variants of a query reuse the
+        embedding computed for the first variant seen.
+
+        Args:
+            texts: A list of query strings.
+            batch_size: The maximum batch size for the model forward pass.
+
+        Returns:
+            A list of embeddings (list[float]) in the same order as `texts`.
+        """
+        results = [None] * len(texts)
+        misses = {} # cache key -> positions in `texts` still needing an embedding
+
+        with self._query_cache_lock:
+            for i, text in enumerate(texts):
+                key = _query_cache_key(text)
+                cached = self._query_cache.get(key)
+                if cached is None:
+                    misses.setdefault(key, []).append(i)
+                else:
+                    self._query_cache.move_to_end(key)
+                    results[i] = list(cached)
+            self.query_cache_hits += len(texts) - len(misses)
+            self.query_cache_misses += len(misses)
+
+        if misses:
+            # Embed the first original text seen for each missing key
+            miss_keys = list(misses)
+            miss_texts = [texts[misses[key][0]] for key in miss_keys]
+            vectors = self.encode(miss_texts, batch_size=min(len(miss_texts), batch_size), convert_to_numpy=True)
+            with self._query_cache_lock:
+                for key, vector in zip(miss_keys, vectors):
+                    self._query_cache[key] = tuple(vector)
+                    for i in misses[key]:
+                        results[i] = list(vector)
+                while len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        return results
+
+    def query_cache_info(self):
+        """
+        Returns query cache statistics, like functools.lru_cache's cache_info().
+        Misses count distinct texts embedded; repeats of a missing text within
+        one call share its embedding and count as hits.
+        """
+        with self._query_cache_lock:
+            return {
+                "hits": self.query_cache_hits,
+                "misses": self.query_cache_misses,
+                "maxsize": QUERY_CACHE_SIZE,
+                "currsize": len(self._query_cache),
+            }
 
 # Create a singleton instance of the embedder
 embedder = Embedder()
\ No newline at end of file
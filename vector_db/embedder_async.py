@@ -0,0 +1,110 @@
+# project_root/vector_db/embedder_async.py
+import asyncio
+from typing import List, Optional # Import for type hinting
+
+# Concurrent encode requests are collected into one batch until it holds
+# EMBED_BATCH_MAX_SIZE texts, or until EMBED_BATCH_MAX_WAIT_SECONDS have passed
+# since the first text arrived.
+EMBED_BATCH_MAX_SIZE = 64
+EMBED_BATCH_MAX_WAIT_SECONDS = 0.005
+
+
+class BatchingEmbedder:
+    """
+    Async front end for an Embedder that coalesces concurrent requests.
+
+    Texts awaited by different coroutines (e.g. concurrent FastAPI requests)
+    are queued and embedded together with one encode_queries() call, which
+    runs in a worker thread so the event loop keeps serving requests while
+    the model runs. Results keep the query cache behaviour of encode_queries().
+    """
+
+    def __init__(self, embedder, max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+                 max_wait_seconds: float = EMBED_BATCH_MAX_WAIT_SECONDS):
+        """
+        Args:
+            embedder: The Embedder to run batches on.
+            max_batch_size: The maximum number of texts embedded together.
+            max_wait_seconds: How long the first queued text waits for others to join its batch.
+        """
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        # Created on first use, for the event loop that is running then
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Returns the request queue, starting the batching task on the running loop if needed."""
+        loop = asyncio.get_running_loop()
+        # Queues and tasks belong to one loop; a new loop (e.g. one per
+        # Lambda invocation) gets its own.
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def aencode(self, text: str) -> List[float]:
+        """Embeds one query text, batched with any other pending requests."""
+        return (await self.aencode_queries([text]))[0]
+
+    async def aencode_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds query texts, batched with any other pending requests.
+
+        Returns:
+            A list of embeddings (list[float]) in the same order as `texts`.
+        """
+        queue = self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            queue.put_nowait((text, future))
+            futures.append(future)
+        # A failed batch sets the same exception on all of its futures; every
+        # one is retrieved here so none is logged as never retrieved at GC.
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def _collect(self, queue: asyncio.Queue) -> list:
+        """Waits for the first queued request, then gathers more until the batch is full or the wait ends."""
+        batch = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue):
+        """Batching task: embeds each collected batch and resolves its futures."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(queue)
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(None, self.embedder.encode_queries, texts, self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                # A caller that was cancelled no longer wants its result
+                if not future.done():
+                    future.set_result(vector)
@@ -0,0 +1,73 @@
+# project_root/vector_db/embedding_cache.py
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple # Import for type hinting
+import numpy as np
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_MODEL_NAME
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache backed by a local SQLite file.
+
+    Rows are keyed by the SHA-256 of the model name and the embedded text, so
+    a document whose taste_text has not changed (e.g. only its feedback_weight
+    was edited) reuses its stored vector instead of being re-embedded, across
+    runs. Vectors are stored as raw float32 bytes.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        """
+        Opens (or creates) the cache database.
+
+        Args:
+            path: The SQLite file to use.
+        """
+        self.path = path
+        # The connection is shared with the ingest pipeline's worker threads;
+        # the lock serializes access to it.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache (sha256 BLOB PRIMARY KEY, vec BLOB NOT NULL)"
+            )
+        print(f"Embedding cache opened at '{path}'.")
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Returns the cache key for `text` under the configured embedding model."""
+        return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Looks up several texts in one query.
+
+        Returns:
+            A dict of text -> float32 embedding for the texts that were cached.
+        """
+        if not texts:
+            return {}
+        keys = {self.key(text): text for text in texts}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT sha256, vec FROM embedding_cache WHERE sha256 IN ({placeholders})", list(keys)
+            ).fetchall()
+        return {keys[sha]: np.frombuffer(vec, dtype=np.float32) for sha, vec in rows}
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        """Stores (text, embedding) pairs, replacing any existing entries."""
+        rows = [(self.key(text), np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in items]
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (sha256, vec) VALUES (?, ?)", rows
+            )
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._connection.close()
@@ -1,10 +1,14 @@
 # project_root/vector_db/pinecone_client.py
-from pinecone import Pinecone, Index, ServerlessSpec
-from config import PINECONE_API_KEY, PINECONE_ENVIRONMENT, PINECONE_INDEX_NAME, PINECONE_DIMENSION
-from vector_db.embedder import embedder # Assumes embedder is a globally available instance
-import time
+from pinecone import ServerlessSpec
+# The gRPC client multiplexes concurrent requests over one persistent HTTP/2
+# channel and serializes vectors as protobuf, which is faster than REST/JSON
+# for both upserts and queries. It is a drop-in replacement for Pinecone.
+from pinecone.grpc import PineconeGRPC as Pinecone
+from config import PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST, PINECONE_DIMENSION
+from db.models import TASTE_TEXT_TEMPLATE
 import os
-from typing import Dict, Any, List, Optional # Import for type hinting
+from collections import deque
+from typing import Callable, Dict, Any, List, Optional, Union # Import for type hinting
 
 # It's generally recommended to use environment variables for sensitive keys
 # Fallback to config if environment variables are not set, but prioritize env vars
@@ -12,6 +16,26 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", PINECONE_API_KEY)
 # Note: PINECONE_ENVIRONMENT is deprecated in recent Pinecone Python client versions
 # We will primarily use region and cloud in ServerlessSpec
 
+# Maximum number of vectors sent in a single upsert request
+UPSERT_BATCH_SIZE = 100
+# Maximum number of async upsert requests in flight at once. Bursting every
+# chunk of a large ingest at the same time trips Pinecone's rate limits.
+MAX_INFLIGHT_UPSERTS = 10
+
+def _is_upsert_vector(vector) -> bool:
+    """True for {"id", "values", ...} dicts and (id, values[, metadata]) tuples."""
+    if isinstance(vector, tuple):
+        return len(vector) in (2, 3)
+    return isinstance(vector, dict) and "id" in vector and "values" in vector
+
+def _matches_above(search_results, min_score: Optional[float]) -> List[Any]:
+    """Returns the matches of a query response scoring at or above min_score (all matches if None)."""
+    if not search_results or not getattr(search_results, 'matches', None):
+        return []
+    if min_score is None:
+        return list(search_results.matches)
+    return [match for match in search_results.matches if match.score >= min_score]
+
 class PineconeManager:
     def __init__(self, embedder):
         """Initializes the Pinecone connection and gets/creates the index."""
@@ -23,6 +47,9 @@ class PineconeManager:
             self.index = None
             return
 
+        # Data-plane host of the index, resolved once (see _get_or_create_index)
+        self._index_host = PINECONE_INDEX_HOST
+
         try:
             self.pinecone = Pinecone(api_key=PINECONE_API_KEY)
             print("Pinecone client initialized.")
@@ -49,10 +76,15 @@ class PineconeManager:
         serverless_region = 'us-east-1'
         index_metric = 'cosine'
 
+        # A known host needs no control-plane lookups at all
+        if self._index_host:
+            print(f"Connecting to Pinecone index '{index_name}' at host '{self._index_host}'...")
+            return self.pinecone.Index(host=self._index_host)
+
         try:
             if self.pinecone.has_index(index_name):
                 print(f"Pinecone index '{index_name}' found. Connecting...")
-                return self.pinecone.Index(index_name)
+                return self._connect_by_host(index_name)
             else:
                 print(f"Pinecone index '{index_name}' does not exist.")
                 print(f"Attempting to create Serverless index '{index_name}' with metric '{index_metric}'...")
@@ -72,49 +104,155 @@ class PineconeManager:
                 #     time.sleep(5)
                 # print(f"Serverless index '{index_name}' created and ready.")
 
-                return self.pinecone.Index(index_name)
+                return self._connect_by_host(index_name)
 
         except Exception as e:
             print(f"Error checking/connecting or creating Pinecone index '{index_name}': {e}")
             return None
 
+    def _connect_by_host(self, index_name: str):
+        """
+        Looks up the index's data-plane host once and connects to it. The host
+        is kept on the manager, so reconnects skip the describe_index call.
+        Set PINECONE_INDEX_HOST to skip it on cold starts too.
+        """
+        self._index_host = self.pinecone.describe_index(index_name).host
+        print(f"Pinecone index '{index_name}' host: '{self._index_host}' (set PINECONE_INDEX_HOST to skip this lookup).")
+        return self.pinecone.Index(host=self._index_host)
+
+
+    def reconnect_index(self):
+        """
+        Replaces the index handle (and its gRPC channel) with a fresh one.
+        Used after a Lambda SnapStart restore, where connections opened before
+        the snapshot cannot be reused.
+        """
+        if not self.pinecone:
+            return
+        try:
+            if self._index_host:
+                self.index = self.pinecone.Index(host=self._index_host)
+            else:
+                self.index = self.pinecone.Index(PINECONE_INDEX_NAME)
+            print(f"Reconnected to Pinecone index '{PINECONE_INDEX_NAME}'.")
+        except Exception as e:
+            print(f"Error reconnecting to Pinecone index '{PINECONE_INDEX_NAME}': {e}")
+            self.index = None
+
 
-    def upsert_vectors(self, vectors_to_upsert: List[Dict[str, Any]], namespace: str = ""):
+    def upsert_vectors(self, vectors_to_upsert: List[Union[Dict[str, Any], tuple]], namespace: str = "", async_mode: bool = True):
         """
         Upserts a list of vectors into the Pinecone index.
 
+        Vectors are sent in chunks of UPSERT_BATCH_SIZE. With async_mode, chunks
+        are dispatched concurrently as gRPC futures (async_req=True),
+        with at most MAX_INFLIGHT_UPSERTS requests outstanding at a time, so large
+        ingests overlap their HTTP round trips without bursting past rate limits.
+
         Args:
             vectors_to_upsert: A list of dictionaries in the format
-                                [{"id": str, "values": list[float], "metadata": dict}, ...].
+                                [{"id": str, "values": list[float], "metadata": dict}, ...],
+                                or of (id, values, metadata) tuples (see TasteRecord.to_upsert).
             namespace: The namespace to upsert into (optional, defaults to "" for default namespace).
+            async_mode: Send chunks in parallel (default True). If False, chunks are sent one at a time.
+
+        Returns:
+            The number of vectors Pinecone reports as upserted (0 on failure).
         """
         if not self.index:
             print("Pinecone index not available for upsert.")
-            return
+            return 0
 
         if not vectors_to_upsert:
             print("No vectors provided for upsert.")
-            return
+            return 0
 
-        if not all(isinstance(v, dict) and "id" in v and "values" in v for v in vectors_to_upsert):
-            print("Invalid upsert format. Expected list of dictionaries with 'id' and 'values'.")
-            return
+        if not all(_is_upsert_vector(v) for v in vectors_to_upsert):
+            print("Invalid upsert format. Expected dictionaries with 'id' and 'values' or (id, values[, metadata]) tuples.")
+            return 0
 
         try:
             print(f"Attempting to upsert {len(vectors_to_upsert)} vectors into Pinecone index '{PINECONE_INDEX_NAME}' namespace '{namespace}'...")
-            upsert_response = self.index.upsert(vectors=vectors_to_upsert, namespace=namespace)
-            print(f"Pinecone upsert complete. Upserted count: {upsert_response.upserted_count}")
+            chunks = [vectors_to_upsert[i:i + UPSERT_BATCH_SIZE] for i in range(0, len(vectors_to_upsert), UPSERT_BATCH_SIZE)]
+
+            if async_mode:
+                # Sliding window: once the window is full, wait for the oldest
+                # request before dispatching the next chunk. .result() re-raises
+                # any error from the worker thread.
+                upsert_responses = []
+                in_flight = deque()
+                for chunk in chunks:
+                    if len(in_flight) >= MAX_INFLIGHT_UPSERTS:
+                        upsert_responses.append(in_flight.popleft().result())
+                    in_flight.append(self.index.upsert(vectors=chunk, namespace=namespace, async_req=True))
+                upsert_responses.extend(upsert_future.result() for upsert_future in in_flight)
+            else:
+                upsert_responses = [self.index.upsert(vectors=chunk, namespace=namespace) for chunk in chunks]
+
+            upserted_count = sum(response.upserted_count for response in upsert_responses)
+            print(f"Pinecone upsert complete. Upserted count: {upserted_count} in {len(chunks)} request(s)")
+            return upserted_count
         except Exception as e:
             print(f"Error during Pinecone upsert: {e}")
+            return 0
+
+    def fetch_vectors(self, vector_ids: List[str], namespace: str = "") -> Dict[str, Any]:
+        """
+        Fetches vectors (with their metadata) by ID in a single request.
+
+        Args:
+            vector_ids: The IDs to fetch.
+            namespace: The namespace of the vectors (optional, defaults to "").
+
+        Returns:
+            A dict of ID -> vector for the IDs that exist (empty on failure).
+        """
+        if not self.index:
+            print("Pinecone index not available for fetch.")
+            return {}
+
+        try:
+            return dict(self.index.fetch(ids=list(vector_ids), namespace=namespace).vectors)
+        except Exception as e:
+            print(f"Error fetching {len(vector_ids)} vectors from Pinecone: {e}")
+            return {}
+
+    def fetch_vector(self, vector_id: str, namespace: str = ""):
+        """Fetches one vector by ID. Returns None if it does not exist or the fetch fails."""
+        return self.fetch_vectors([vector_id], namespace=namespace).get(vector_id)
+
+    def update_metadata(self, vector_id: str, metadata: Dict[str, Any], namespace: str = "") -> bool:
+        """
+        Overwrites metadata fields of an existing vector without re-sending its values.
+
+        Args:
+            vector_id: The ID of the vector to update.
+            metadata: The metadata fields to set.
+            namespace: The namespace of the vector (optional, defaults to "").
+
+        Returns:
+            True if the update request succeeded, otherwise False.
+        """
+        if not self.index:
+            print("Pinecone index not available for metadata update.")
+            return False
+
+        try:
+            self.index.update(id=vector_id, set_metadata=metadata, namespace=namespace)
+            return True
+        except Exception as e:
+            print(f"Error updating metadata for vector '{vector_id}': {e}")
+            return False
 
 
     def search(self, query_vector: List[float], top_k: int = 5,
                user_id: Optional[str] = None, ingredient: Optional[str] = None,
+               cuisine: Optional[str] = None,
                filter: Optional[Dict[str, Any]] = None, namespace: str = "",
                min_score: Optional[float] = None): # Added min_score parameter
         """
         Performs a similarity search in the Pinecone index.
-        Filters by user_id and ingredient metadata *before* similarity search.
+        Filters by user_id, ingredient and cuisine metadata *before* similarity search.
         Explicitly filters results to include only matches with a similarity score
         at or above the specified min_score.
 
@@ -123,6 +261,8 @@ class PineconeManager:
             top_k: The number of nearest neighbors to retrieve.
             user_id: Optional user ID to filter results by exact metadata match.
             ingredient: Optional ingredient name to filter results by exact metadata match.
+            cuisine: Optional cuisine name to filter results by exact metadata match.
+                     Narrows the candidate set Pinecone has to score.
             filter: An optional dictionary for additional metadata filtering.
                     If user_id and ingredient are provided, this filter is combined.
             namespace: The namespace to search within (optional, defaults to "" for default namespace).
@@ -141,7 +281,7 @@ class PineconeManager:
              return [] # Return empty list on invalid input
 
         # --- Construct the effective filter ---
-        # Combine user_id and ingredient filtering with any additional filter provided
+        # Combine user_id/ingredient/cuisine filtering with any additional filter provided
         effective_filter = {}
 
         if user_id is not None:
@@ -155,6 +295,10 @@ class PineconeManager:
             # a lowercased version in metadata or use Pinecone's text matching features if available/suitable.
             # Assuming exact string match for now.
 
+        if cuisine is not None:
+            effective_filter["cuisine"] = cuisine
+            print(f"Adding cuisine='{cuisine}' to filter.")
+
         # If an additional filter dictionary was provided, combine it
         if filter is not None:
              if effective_filter: # If we already added user_id/ingredient filters
@@ -174,30 +318,22 @@ class PineconeManager:
 
         try:
             print(f"Performing Pinecone query in index '{PINECONE_INDEX_NAME}' namespace '{namespace}' (top_k={top_k}, min_score={min_score})...")
-            # Pass the min_score to the Pinecone query call
+            # The query API has no score threshold; min_score is applied below.
+            # (The gRPC client would reject an unknown min_score argument.)
             search_results = self.index.query(
                 namespace=namespace, # Specify the namespace
                 vector=query_vector,
                 top_k=top_k,
-                include_values=True,
+                # Callers only read id/score/metadata; returning each match's
+                # full vector would dominate the response size.
+                include_values=False,
                 include_metadata=True,
-                filter=effective_filter, # Pass the constructed effective filter here
-                min_score=min_score # Pass the min_score parameter here (Pinecone should filter, but we'll double check)
+                filter=effective_filter # Pass the constructed effective filter here
             )
             print("Pinecone query complete.")
 
-            # --- Explicitly filter results by min_score after the query ---
-            # This ensures the threshold is strictly applied, even if Pinecone's min_score
-            # behavior is not exactly as expected in all cases or versions.
-            filtered_matches_by_score = []
-            if search_results and hasattr(search_results, 'matches') and search_results.matches:
-                 for match in search_results.matches:
-                      # Check if min_score is provided AND the match score is below it
-                      if min_score is not None and match.score < min_score:
-                           # Skip this match if its score is below the threshold
-                           continue
-                      # If no min_score is provided, or the score is >= min_score, include the match
-                      filtered_matches_by_score.append(match)
+            # --- Filter results by min_score after the query ---
+            filtered_matches_by_score = _matches_above(search_results, min_score)
 
             print(f"Explicitly filtered results by min_score ({min_score if min_score is not None else 'None'}). Found {len(filtered_matches_by_score)} matches meeting criteria.")
 
@@ -209,13 +345,140 @@ class PineconeManager:
             print(f"Error during Pinecone search: {e}")
             return []
 
+    def batch_search(self, query_vectors: List[List[float]], ingredients: List[str], top_k: int = 5,
+                     user_id: Optional[str] = None, cuisine: Optional[str] = None,
+                     namespace: str = "", min_score: Optional[float] = None) -> List[List[Any]]:
+        """
+        Runs one filtered similarity search per (query vector, ingredient) pair,
+        with every query in flight at once.
+
+        The Pinecone API has no multi-vector query, so each query is dispatched
+        as a gRPC future (async_req=True) over the index's single HTTP/2 channel
+        before any result is awaited: K queries cost about one round trip
+        rather than K, without a thread per query.
+
+        Args:
+            query_vectors: One query embedding (list[float]) per ingredient.
+            ingredients: The ingredient each query is filtered on, in the same order.
+            top_k: The number of nearest neighbors to retrieve per query.
+            user_id: Optional user ID every query is filtered by.
+            cuisine: Optional cuisine every query is filtered by.
+            namespace: The namespace to search within (optional, defaults to "" for default namespace).
+            min_score: Optional minimum similarity score for results.
+
+        Returns:
+            One list of matches (at or above min_score) per query, in input order.
+            A query that fails yields an empty list, as in search().
+        """
+        return self.start_batch_search(query_vectors, ingredients, top_k=top_k, user_id=user_id,
+                                       cuisine=cuisine, namespace=namespace, min_score=min_score)()
+
+    def start_batch_search(self, query_vectors: List[List[float]], ingredients: List[str], top_k: int = 5,
+                           user_id: Optional[str] = None, cuisine: Optional[str] = None,
+                           namespace: str = "", min_score: Optional[float] = None) -> Callable[[], List[List[Any]]]:
+        """
+        Dispatches the queries of batch_search() without waiting for them.
+
+        Callers can do other work (e.g. embed the next batch of queries) while
+        the queries are in flight, then call the returned function to wait for
+        and collect the results. Arguments are the same as batch_search().
+
+        Returns:
+            A no-argument function returning what batch_search() would return.
+        """
+        if not self.index:
+            print("Pinecone index not available for search.")
+            return lambda: [[] for _ in query_vectors]
+
+        base_filter = {}
+        if user_id is not None:
+            base_filter["user_id"] = user_id
+        if cuisine is not None:
+            base_filter["cuisine"] = cuisine
+
+        print(f"Performing {len(query_vectors)} concurrent Pinecone queries in index '{PINECONE_INDEX_NAME}' namespace '{namespace}' (top_k={top_k}, min_score={min_score})...")
+        query_futures = []
+        for query_vector, ingredient in zip(query_vectors, ingredients):
+            try:
+                query_futures.append(self.index.query(
+                    namespace=namespace,
+                    vector=query_vector,
+                    top_k=top_k,
+                    include_values=False, # Only id/score/metadata are used, as in search()
+                    include_metadata=True,
+                    filter={**base_filter, "ingredient": ingredient},
+                    async_req=True
+                ))
+            except TypeError:
+                # This index client has no async_req; run the query synchronously instead
+                query_futures.append(self.search(query_vector, top_k=top_k, user_id=user_id,
+                                                 ingredient=ingredient, cuisine=cuisine,
+                                                 namespace=namespace, min_score=min_score))
+            except Exception as e:
+                print(f"Error dispatching Pinecone search for '{ingredient}': {e}")
+                query_futures.append(None)
+
+        def collect_results() -> List[List[Any]]:
+            results = []
+            for query_future, ingredient in zip(query_futures, ingredients):
+                if query_future is None:
+                    results.append([])
+                    continue
+                if isinstance(query_future, list): # Already resolved by the synchronous fallback
+                    results.append(query_future)
+                    continue
+                try:
+                    results.append(_matches_above(query_future.result(), min_score))
+                except Exception as e:
+                    print(f"Error during Pinecone search for '{ingredient}': {e}")
+                    results.append([])
+            print("Pinecone batch query complete.")
+            return results
+
+        return collect_results
+
+    def upsert_texts(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], namespace: str = "") -> int:
+        """
+        Embeds texts in one batched encode() call and upserts them with their IDs and metadata.
+
+        Args:
+            ids: The vector IDs, one per text.
+            texts: The texts to embed.
+            metadatas: The metadata to store with each vector.
+            namespace: The namespace to upsert into (optional, defaults to "").
+
+        Returns:
+            The number of vectors Pinecone reports as upserted (0 on failure).
+        """
+        if not self.embedder:
+            print("Embedding model not available in PineconeManager. Cannot embed texts for upsert.")
+            return 0
+
+        if not (len(ids) == len(texts) == len(metadatas)):
+            print(f"Mismatched upsert_texts() inputs: {len(ids)} ids, {len(texts)} texts, {len(metadatas)} metadatas.")
+            return 0
+
+        if not texts:
+            return 0
+
+        try:
+            # One padded forward pass; the float32 rows are passed to the
+            # Pinecone client as-is (see Embedder.encode)
+            embeddings = self.embedder.encode(list(texts), as_numpy=True)
+        except Exception as e:
+            print(f"Error embedding {len(texts)} texts for upsert: {e}")
+            return 0
+
+        return self.upsert_vectors(list(zip(ids, embeddings, metadatas)), namespace=namespace)
+
     # Modified update_user_taste_feedback function for similarity search + user filter
     # This version searches by similarity (ingredient+cuisine) within the user's data,
     # then finds the exact metadata match in the results to update.
     # It is less reliable for finding the exact item compared to using a precise filter initially.
     # In your PineconeManager class in vector_db/pinecone_client.py
 
-    def update_user_taste_feedback(self, user_id: str, ingredient: str, cuisine: str, feedback: str, namespace: str = "") -> str | None:
+    def update_user_taste_feedback(self, user_id: str, ingredient: str, cuisine: str, feedback: str, namespace: str = "",
+                                   pinecone_id: Optional[str] = None) -> str | None:
         """
         Finds a user taste preference by user_id and embedded ingredient (sorted by feedback_weight),
         updates its amount/weight based on feedback, and re-upserts the vector.
@@ -227,164 +490,250 @@ class PineconeManager:
             cuisine: The cuisine of the taste preference (used in taste_text reconstruction and metadata).
             feedback: Feedback string ("more", "less", "perfect").
             namespace: The namespace where the vector is stored (optional).
+            pinecone_id: Optional ID of the vector to update (e.g. returned by an
+                         earlier update). It is fetched directly instead of being
+                         searched for, if it exists and belongs to user_id.
 
         Returns:
             The pinecone_id of the updated vector if successful, otherwise None.
         """
+        feedback_item = {"user_id": user_id, "ingredient": ingredient, "cuisine": cuisine, "feedback": feedback,
+                         "pinecone_id": pinecone_id}
+        return self.update_user_taste_feedback_batch([feedback_item], namespace=namespace)[0]
+
+    def update_user_taste_feedback_batch(self, feedback_items: List[Dict[str, str]], namespace: str = "") -> List[Optional[str]]:
+        """
+        Applies several feedback updates (see update_user_taste_feedback) together.
+
+        Items with a pinecone_id are fetched by ID in one call; the other
+        items' search queries are embedded in one batched call. All updated
+        taste texts are re-embedded in one batched call and written with a
+        single upsert_vectors() call, instead of two forward passes and one
+        upsert per item.
+
+        Args:
+            feedback_items: Dicts with "user_id", "ingredient", "cuisine" and "feedback" keys,
+                            and optionally the "pinecone_id" of the preference to update.
+            namespace: The namespace where the vectors are stored (optional).
+
+        Returns:
+            One entry per item, in order: the pinecone_id of the updated vector,
+            or None if that item was not updated. Items resolving to the same
+            vector all report its ID; the last of them is the one written.
+        """
+        updated_ids: List[Optional[str]] = [None] * len(feedback_items)
+
         if not self.index:
             print("Pinecone index not available for update.")
-            return None
+            return updated_ids
 
         if not self.embedder:
             print("Embedding model not available in PineconeManager. Cannot update vector.")
-            return None
+            return updated_ids
 
         valid_feedbacks = ["more", "less", "perfect"]
-        if feedback not in valid_feedbacks:
-            print(f"Invalid feedback provided: '{feedback}'. Expected one of {valid_feedbacks}.")
-            return None
-
-        try:
-            print(f"Attempting to find taste for user '{user_id}' by ingredient '{ingredient}' in namespace '{namespace}' for feedback '{feedback}'...")
-
-            # --- Step 1: Find the existing taste using a search (Based on User's Logic) ---
-            # Embed the ingredient text as the query vector
-            # Ensure .tolist() is used if embedder.encode returns numpy array
-            try:
-                embedding = self.embedder.encode(ingredient).tolist()
-            except AttributeError:
-                 embedding = self.embedder.encode(ingredient)
-                 if not isinstance(embedding, list):
-                     print(f"Warning: Embedder did not return a list or numpy array for ingredient '{ingredient}'. Cannot proceed.")
-                     return None
-
-            # Perform search filtered by user_id, using the embedded ingredient
-            existing_response = self.search(
-                query_vector=embedding,
-                filter={"user_id": user_id}, # Filter by user_id
-                namespace=namespace # Include namespace in search
-            )
-
-            # Check if search returned any matches
-            if not existing_response or not existing_response.matches:
-                print(f"No relevant taste preferences found for user '{user_id}' based on ingredient '{ingredient}'.")
-                return None
-
-            # --- Step 2: Sort results by feedback_weight and take the first match (Based on User's Logic) ---
-            # Note: This is the part that is unreliable for finding a *specific* item
-            # if a user has multiple similar entries or entries with the same feedback weight.
-            sorted_response = sorted(
-                existing_response.matches,
-                key=lambda x: x.metadata.get('feedback_weight', 1.0), # Safely get weight with default
-                reverse=True # Sort by feedback_weight descending
-            )
-
-            # Get the metadata and ID of the top-ranked result
-            existing_match = sorted_response[0]
-            existing_metadata = existing_match.metadata
-            pinecone_id_to_update = existing_match.id
-
-            # Basic check if the top match metadata is valid
-            if not existing_metadata or existing_metadata.get("amount") is None:
-                 print(f"Metadata for the top match (ID: {pinecone_id_to_update}) is missing or invalid. Cannot update.")
-                 return None
-
-
-            print(f"Top match found for user '{user_id}', ID: '{pinecone_id_to_update}'. Using this for update.")
-
-
-            # --- Step 3: Adjust amount and weight based on feedback ---
-            # Extract necessary fields from existing metadata
-            # Add type casting for safety, based on previous debugging
-            amount = existing_metadata.get("amount")
-            unit = existing_metadata.get("unit", "")
-            servings = existing_metadata.get("servings")
-            feedback_weight = existing_metadata.get("feedback_weight", 1.0) # Default value
-
-            # Attempt to cast amount and weight to float if they are not already
-            if not isinstance(amount, (int, float)):
-                 try:
-                     amount = float(amount)
-                 except (ValueError, TypeError):
-                     print(f"Warning: Could not convert amount '{amount}' to float for ID '{pinecone_id_to_update}'. Cannot update amount.")
-                     amount = existing_metadata.get("amount") # Keep original if casting fails
-
-            if not isinstance(feedback_weight, (int, float)):
-                 try:
-                     feedback_weight = float(feedback_weight)
-                 except (ValueError, TypeError):
-                     print(f"Warning: Could not convert feedback_weight '{feedback_weight}' to float for ID '{pinecone_id_to_update}'. Using default 1.0.")
-                     feedback_weight = 1.0 # Use default if casting fails
-
-
-            # Ensure amount and servings are available before calculating new_amount
-            if amount is None or servings is None:
-                 print(f"Missing or invalid required metadata fields (amount or servings) for vector ID '{pinecone_id_to_update}'. Cannot calculate new amount.")
-                 # Only proceed with weight update if amount/servings are missing
-                 new_amount = existing_metadata.get("amount") # Keep original amount if calculation cannot happen
+        positions = []
+        for position, item in enumerate(feedback_items):
+            if item.get("feedback") not in valid_feedbacks:
+                print(f"Invalid feedback provided: '{item.get('feedback')}'. Expected one of {valid_feedbacks}.")
             else:
-                 new_amount = amount # Start with the current amount
-                 if feedback == "more":
-                     new_amount = amount * 1.1
-                 elif feedback == "less":
-                     new_amount = amount * 0.9
-                 # else: feedback == "perfect", new_amount remains the same
-
-
-            new_weight = feedback_weight # Start with current weight
-            if feedback == "perfect":
-                 new_weight = feedback_weight + 1.0 # Increase by 1.0 as per latest request
+                positions.append(position)
+
+        if not positions:
+            return updated_ids
+
+        # --- Step 1: Find the existing taste for every item ---
+        # Items that carry the pinecone_id of their preference (e.g. from an
+        # earlier update response) are looked up with one fetch by ID, which
+        # skips their query embedding and similarity search.
+        existing_by_position: Dict[int, List[Any]] = {}
+        fetch_ids = list(dict.fromkeys(
+            feedback_items[position]["pinecone_id"] for position in positions if feedback_items[position].get("pinecone_id")
+        ))
+        fetched_vectors = self.fetch_vectors(fetch_ids, namespace=namespace) if fetch_ids else {}
+        for position in positions:
+            item = feedback_items[position]
+            vector = fetched_vectors.get(item.get("pinecone_id"))
+            # A vector can only be updated through its ID by the user it belongs to
+            if vector is not None and vector.metadata and vector.metadata.get("user_id") == item["user_id"]:
+                existing_by_position[position] = [vector]
+            elif item.get("pinecone_id"):
+                print(f"Vector '{item['pinecone_id']}' not found for user '{item['user_id']}'. Falling back to a similarity search.")
+
+        # The rest are found by similarity search, as in update_user_taste_feedback
+        search_positions = [position for position in positions if position not in existing_by_position]
+        query_embeddings = []
+        if search_positions:
+            try:
+                # Embed every remaining ingredient query in one batched call.
+                # Goes through the embedder's query LRU, so repeated feedback on the
+                # same ingredient (and warm Lambda invocations) skip the forward pass.
+                query_embeddings = self.embedder.encode_queries([feedback_items[position]["ingredient"] for position in search_positions])
+            except Exception as e:
+                print(f"Error embedding {len(search_positions)} feedback queries: {e}")
+
+        for position, embedding in zip(search_positions, query_embeddings):
+            item = feedback_items[position]
+            user_id, ingredient, feedback = item["user_id"], item["ingredient"], item["feedback"]
+            try:
+                print(f"Attempting to find taste for user '{user_id}' by ingredient '{ingredient}' in namespace '{namespace}' for feedback '{feedback}'...")
 
-            # --- Step 4: Reconstruct text, re-embed, update metadata, and upsert ---
-            # Use the ingredient and cuisine from the function arguments here,
-            # and the calculated new_amount and original unit/servings from metadata.
-            updated_taste_text = f"{ingredient} {new_amount}{unit} for {servings} servings in {cuisine} cuisine"
+                # Perform search filtered by user_id, using the embedded ingredient
+                existing_response = self.search(
+                    query_vector=embedding,
+                    filter={"user_id": user_id}, # Filter by user_id
+                    namespace=namespace # Include namespace in search
+                )
 
-            # Re-embed the updated text
+                # Check if search returned any matches (search returns a plain list)
+                if not existing_response:
+                    print(f"No relevant taste preferences found for user '{user_id}' based on ingredient '{ingredient}'.")
+                    continue
+                existing_by_position[position] = existing_response
+
+            except Exception as e:
+                print(f"Error searching taste preferences for user '{user_id}', ingredient '{ingredient}': {e}")
+
+        # pinecone_id -> (updated_taste_text, updated_metadata, item positions).
+        # Later items for the same vector replace earlier ones, so each ID is
+        # sent once.
+        updates_by_id: Dict[str, tuple] = {}
+        for position in positions:
+            if position not in existing_by_position:
+                continue
+            item = feedback_items[position]
+            user_id, ingredient, cuisine, feedback = item["user_id"], item["ingredient"], item["cuisine"], item["feedback"]
             try:
-                updated_embedding = self.embedder.encode(updated_taste_text).tolist()
-            except AttributeError:
-                 updated_embedding = self.embedder.encode(updated_taste_text)
-                 if not isinstance(updated_embedding, list):
-                     print(f"Warning: Embedder did not return a list or numpy array for updated text. Cannot re-embed.")
-                     return None
-
-            # Prepare updated metadata - Update specific fields while keeping others from the original match
-            updated_metadata = existing_metadata.copy()
-            updated_metadata.update({
-                "amount": new_amount, # Use the calculated new amount
-                "feedback_weight": new_weight, # Use the calculated new weight
-                "original_text": updated_taste_text, # Update original text
-                # Ensure other essential fields are present, even if they weren't changed
-                "user_id": user_id, # Use the user_id from function argument for certainty
-                "ingredient": ingredient, # Use ingredient from function argument for certainty
-                "cuisine": cuisine # Use cuisine from function argument for certainty
-            })
-
-            # Prepare data for upsert (using the correct dictionary format) - list containing one vector
-            vector_to_upsert = {
-                "id": pinecone_id_to_update, # Use the ID of the found match
-                "values": updated_embedding,
-                "metadata": updated_metadata
-            }
-
-            # --- Step 5: Upsert the updated vector ---
-            print(f"Upserting updated vector for ID '{pinecone_id_to_update}' in namespace '{namespace}'...")
-            # Upsert the list containing the single vector dictionary
-            upsert_response = self.index.upsert(vectors=[vector_to_upsert], namespace=namespace)
-            print(f"Pinecone update for ID '{pinecone_id_to_update}' complete. Upserted count: {upsert_response.upserted_count}")
-
-            if upsert_response.upserted_count > 0:
-                 print(f"Vector '{pinecone_id_to_update}' updated successfully.")
-                 return pinecone_id_to_update # Return the ID on success
-            else:
-                 print(f"Vector '{pinecone_id_to_update}' was not updated (might indicate an issue).")
-                 return None # Return None if upsert count is 0
+                update = self._build_feedback_update(existing_by_position[position], user_id, ingredient, cuisine, feedback)
+                if update is None:
+                    continue
+                pinecone_id_to_update, updated_taste_text, updated_metadata = update
+                earlier_positions = updates_by_id.pop(pinecone_id_to_update, (None, None, []))[2]
+                updates_by_id[pinecone_id_to_update] = (updated_taste_text, updated_metadata, earlier_positions + [position])
+
+            except Exception as e:
+                print(f"Error updating taste feedback for user '{user_id}', ingredient '{ingredient}', cuisine '{cuisine}': {e}")
+                # Consider adding more specific error logging based on the type of exception
+
+        if not updates_by_id:
+            return updated_ids
+
+        # --- Step 5: Re-embed every updated text and upsert them together ---
+        pinecone_ids = list(updates_by_id)
+        print(f"Upserting {len(pinecone_ids)} updated vector(s) in namespace '{namespace}'...")
+        upserted_count = self.upsert_texts(
+            pinecone_ids,
+            [updates_by_id[pinecone_id][0] for pinecone_id in pinecone_ids],
+            [updates_by_id[pinecone_id][1] for pinecone_id in pinecone_ids],
+            namespace=namespace
+        )
+
+        if upserted_count == len(pinecone_ids):
+            for pinecone_id in pinecone_ids:
+                print(f"Vector '{pinecone_id}' updated successfully.")
+                for position in updates_by_id[pinecone_id][2]:
+                    updated_ids[position] = pinecone_id # Return the ID on success
+        else:
+            print(f"Only {upserted_count} of {len(pinecone_ids)} updated vectors were upserted (might indicate an issue).")
+
+        return updated_ids
+
+    @staticmethod
+    def _build_feedback_update(existing_response: List[Any], user_id: str, ingredient: str, cuisine: str,
+                               feedback: str) -> Optional[tuple]:
+        """
+        Picks the match to update from a feedback search and computes its new
+        amount, weight, taste text and metadata.
 
-        except Exception as e:
-            print(f"Error updating taste feedback for user '{user_id}', ingredient '{ingredient}', cuisine '{cuisine}': {e}")
-            # Consider adding more specific error logging based on the type of exception
-            return None # Return None on exception
+        Returns:
+            (pinecone_id, updated_taste_text, updated_metadata), or None if the
+            top match cannot be updated.
+        """
+        # --- Step 2: Sort results by feedback_weight and take the first match (Based on User's Logic) ---
+        # Note: This is the part that is unreliable for finding a *specific* item
+        # if a user has multiple similar entries or entries with the same feedback weight.
+        sorted_response = sorted(
+            existing_response,
+            key=lambda x: x.metadata.get('feedback_weight', 1.0), # Safely get weight with default
+            reverse=True # Sort by feedback_weight descending
+        )
+
+        # Get the metadata and ID of the top-ranked result
+        existing_match = sorted_response[0]
+        existing_metadata = existing_match.metadata
+        pinecone_id_to_update = existing_match.id
+
+        # Basic check if the top match metadata is valid
+        if not existing_metadata or existing_metadata.get("amount") is None:
+             print(f"Metadata for the top match (ID: {pinecone_id_to_update}) is missing or invalid. Cannot update.")
+             return None
+
+
+        print(f"Top match found for user '{user_id}', ID: '{pinecone_id_to_update}'. Using this for update.")
+
+
+        # --- Step 3: Adjust amount and weight based on feedback ---
+        # Extract necessary fields from existing metadata
+        # Add type casting for safety, based on previous debugging
+        amount = existing_metadata.get("amount")
+        unit = existing_metadata.get("unit", "")
+        servings = existing_metadata.get("servings")
+        feedback_weight = existing_metadata.get("feedback_weight", 1.0) # Default value
+
+        # Attempt to cast amount and weight to float if they are not already
+        if not isinstance(amount, (int, float)):
+             try:
+                 amount = float(amount)
+             except (ValueError, TypeError):
+                 print(f"Warning: Could not convert amount '{amount}' to float for ID '{pinecone_id_to_update}'. Cannot update amount.")
+                 amount = existing_metadata.get("amount") # Keep original if casting fails
+
+        if not isinstance(feedback_weight, (int, float)):
+             try:
+                 feedback_weight = float(feedback_weight)
+             except (ValueError, TypeError):
+                 print(f"Warning: Could not convert feedback_weight '{feedback_weight}' to float for ID '{pinecone_id_to_update}'. Using default 1.0.")
+                 feedback_weight = 1.0 # Use default if casting fails
+
+
+        # Ensure amount and servings are available before calculating new_amount
+        if amount is None or servings is None:
+             print(f"Missing or invalid required metadata fields (amount or servings) for vector ID '{pinecone_id_to_update}'. Cannot calculate new amount.")
+             # Only proceed with weight update if amount/servings are missing
+             new_amount = existing_metadata.get("amount") # Keep original amount if calculation cannot happen
+        else:
+             new_amount = amount # Start with the current amount
+             if feedback == "more":
+                 new_amount = amount * 1.1
+             elif feedback == "less":
+                 new_amount = amount * 0.9
+             # else: feedback == "perfect", new_amount remains the same
+
+
+        new_weight = feedback_weight # Start with current weight
+        if feedback == "perfect":
+             new_weight = feedback_weight + 1.0 # Increase by 1.0 as per latest request
+
+        # --- Step 4: Reconstruct text and update metadata (re-embedded by the caller) ---
+        # Use the ingredient and cuisine from the function arguments here,
+        # and the calculated new_amount and original unit/servings from metadata.
+        updated_taste_text = TASTE_TEXT_TEMPLATE.format(
+            ingredient=ingredient, amount=new_amount, unit=unit, servings=servings, cuisine=cuisine
+        )
+
+        # Prepare updated metadata - Update specific fields while keeping others from the original match
+        updated_metadata = existing_metadata.copy()
+        updated_metadata.update({
+            "amount": new_amount, # Use the calculated new amount
+            "feedback_weight": new_weight, # Use the calculated new weight
+            "original_text": updated_taste_text, # Update original text
+            # Ensure other essential fields are present, even if they weren't changed
+            "user_id": user_id, # Use the user_id from function argument for certainty
+            "ingredient": ingredient, # Use ingredient from function argument for certainty
+            "cuisine": cuisine # Use cuisine from function argument for certainty
+        })
+
+        return pinecone_id_to_update, updated_taste_text, updated_metadata
 
 
 # Remove the singleton instance creation here.